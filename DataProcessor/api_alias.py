@@ -0,0 +1,76 @@
+import os
+import json
+from typing import Dict, List
+
+from DataProcessor.inspect_signature import path_rank
+
+
+
+ALIAS_FILES = ['function_ref.json', 'method_ref.json']
+
+
+def load_alias_index(snapshot_dir) -> Dict[str, str]:
+    '''
+    {spelling: canonical API} of a snapshot, i.e. torch.nn.Linear.to -> torch.nn.Module.to,
+    read from the function_ref.json / method_ref.json saved by the inspector
+    '''
+    aliases = {}
+    for fname in ALIAS_FILES:
+        path = os.path.join(snapshot_dir, fname)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                aliases.update(json.load(f))
+    return aliases
+
+
+def is_private_path(path):
+    return any(part.startswith('_') and part not in ['__init__', '__call__'] for part in path.split('.'))
+
+
+def api_spellings(aliases: Dict[str, str]) -> Dict[str, List[str]]:
+    '''invert the alias index: canonical API -> its other spellings, the best one first'''
+    spellings = {}
+    for alias, canonical in aliases.items():
+        spellings.setdefault(canonical, []).append(alias)
+    for names in spellings.values():
+        names.sort(key=path_rank)
+    return spellings
+
+
+def public_spellings(api, spellings: Dict[str, List[str]]) -> List[str]:
+    '''
+    the names real code uses for api: its own name if that is public, then its public aliases,
+    a private canonical name is only kept when the API has no public spelling at all
+    '''
+    names = sorted({name for name in spellings.get(api, []) if not is_private_path(name)} - {api}, key=path_rank)
+    if not is_private_path(api) or not names:
+        names.insert(0, api)
+    return names
+
+
+def match_renamed_apis(old_names, old_refs: Dict[str, str], new_names, new_refs: Dict[str, str]) -> Dict[str, str]:
+    '''
+    {old key: new key} of APIs stored under another key in the new snapshot, i.e. a method saved under another
+    public path of its class or a function moved to another module, found through the spellings of the
+    *_ref.json of either snapshot.
+    old_names: keys only in the old snapshot, new_names: keys only in the new snapshot
+    '''
+    old_names, new_names = set(old_names), set(new_names)
+    old_spellings, new_spellings = api_spellings(old_refs), api_spellings(new_refs)
+    renamed = {}
+    for old_name in sorted(old_names, key=path_rank):
+        for spelling in [old_name] + old_spellings.get(old_name, []):
+            new_name = new_refs.get(spelling, spelling)
+            if new_name in new_names:
+                renamed[old_name] = new_name
+                new_names.discard(new_name)
+                break
+    old_names -= set(renamed)
+    for new_name in sorted(new_names, key=path_rank):
+        for spelling in [new_name] + new_spellings.get(new_name, []):
+            old_name = old_refs.get(spelling, spelling)
+            if old_name in old_names:
+                renamed[old_name] = new_name
+                old_names.discard(old_name)
+                break
+    return renamed
@@ -15,6 +15,14 @@ from step2_method_invoke_match import method_api_detector
 
 
 
+# {spelling: canonical API} index of the inspector, set in each worker by set_alias_index
+ALIAS_INDEX = {}
+
+
+def set_alias_index(aliases):
+    global ALIAS_INDEX
+    ALIAS_INDEX = aliases or {}
+
 
 def get_code_via_node(code, node):
     lines = code.splitlines()
@@ -138,7 +146,9 @@ def find_api_calling_functions(root_lib, sample, lib=None, lib_dict=None):
                         continue
 
                     # if base_alias in lib:
-                    full_api_name = api_name.replace(base_alias, lib_dict[base_alias], 1)
+                    spelled_api_name = api_name.replace(base_alias, lib_dict[base_alias], 1)
+                    # public re-export paths are recorded as the API they refer to
+                    full_api_name = ALIAS_INDEX.get(spelled_api_name, spelled_api_name)
                     if full_api_name not in visited_api_name:
                         visited_api_name.add(full_api_name)
                     else:
@@ -146,6 +156,8 @@ def find_api_calling_functions(root_lib, sample, lib=None, lib_dict=None):
                     api_code = get_code_via_node(code, node)
                     item = {
                         'API_path': full_api_name,
+                        # how the code spells the API, to locate the call in it
+                        'spelled_as': spelled_api_name,
                         'start_line_no': sub_node.lineno - node.lineno + 1,
                         'end_line_no': sub_node.end_lineno - node.lineno + 1,
                         'import': import_statements,
@@ -205,7 +217,7 @@ def process_sample(info):
     return find_api_calling_functions(info['lib'], info['sample'])
 
 
-def function_api_detector(config):
+def function_api_detector(config, aliases=None):
     files = jsonl_file_search(os.path.join(config.raw_data_dir, 'function'))
     ds = load_dataset('json', data_files=files, split='train')    
     max_cnt = ds.num_rows
@@ -214,7 +226,7 @@ def function_api_detector(config):
 
     codes = []
     write_cnt = 0
-    with Pool(cpu_count()) as pool:
+    with Pool(cpu_count(), initializer=set_alias_index, initargs=(aliases,)) as pool:
         for lib in config.lib_names: 
             data_dir = os.path.join(config.data_dir, lib)
             if not os.path.exists(data_dir):
@@ -237,9 +249,9 @@ def function_api_detector(config):
 
 
 
-def api_detector(config):
-    function_api_detector(config)
-    method_api_detector(config)
+def api_detector(config, aliases=None):
+    function_api_detector(config, aliases)
+    method_api_detector(config, aliases)
 
     # for lib in config.lib_names: 
     #     data_dir = os.path.join(config.data_dir, lib)
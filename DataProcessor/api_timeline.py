@@ -0,0 +1,141 @@
+import os
+import argparse
+from typing import Dict, List, Optional
+
+from util.path import write2json, json2list
+from hparams.get_config import get_dataset_config
+from DataProcessor.api_update import api_updating, inspect_api_versions, load_refs
+from DataProcessor.signature_store import SignatureStore
+
+
+
+CHANGE_TYPES = ['added', 'deleted', 'required_args', 'optional_args']
+
+
+class APITimeline:
+    """
+    Evolution of the APIs of one library over an ordered list of releases.
+
+    The index only records the releases in which an API changed, i.e. {kind: {api_name: [[version, change], ...]}},
+    where change is one of CHANGE_TYPES, so "first version where X changed" is a single lookup.
+    """
+    def __init__(self, lib, versions: List[str], index: Optional[Dict] = None):
+        self.lib = lib
+        self.versions = versions
+        self.index = index or {'function': {}, 'method': {}}
+
+    def record(self, kind, api_name, version, change):
+        self.index[kind].setdefault(api_name, []).append([version, change])
+
+    def changes(self, api_name, kind=None) -> List[List[str]]:
+        kinds = [kind] if kind else list(self.index.keys())
+        for kind in kinds:
+            if api_name in self.index[kind]:
+                return self.index[kind][api_name]
+        return []
+
+    def first_change(self, api_name, kind=None, change_types=None) -> Optional[str]:
+        '''first release in which api_name changed, optionally only counting given change types'''
+        for version, change in self.changes(api_name, kind):
+            if change_types is None or change in change_types:
+                return version
+        return None
+
+    def save(self, path):
+        write2json({'lib': self.lib, 'versions': self.versions, 'index': self.index}, path)
+
+    @classmethod
+    def load(cls, path):
+        data = json2list(path)
+        return cls(data['lib'], data['versions'], data['index'])
+
+
+def build_api_timeline(lib, versions, result_dir, store_path=None) -> APITimeline:
+    '''
+    Diff consecutive releases whose signatures were already saved into result_dir/{lib}/{lib}-{version}-api.
+
+    Each snapshot is loaded once, the diff of every pair is saved into result_dir/{lib}/timeline/{old}_{new}/{kind}
+    and the per-API index into result_dir/{lib}/timeline/index.json.
+    With store_path, the releases are diffed by queries over a SignatureStore, which must already hold them.
+    '''
+    lib_dir = os.path.join(result_dir, lib)
+    timeline_dir = os.path.join(lib_dir, 'timeline')
+    timeline = APITimeline(lib, versions)
+    store = SignatureStore(store_path) if store_path is not None else None
+
+    def load(version, kind):
+        '''(APIs, refs) of a snapshot'''
+        if store is not None:
+            return None, None
+        snapshot_dir = os.path.join(lib_dir, f'{lib}-{version}-api')
+        return json2list(os.path.join(snapshot_dir, f'{kind}.json')), load_refs(snapshot_dir, kind)
+
+    for kind in ['function', 'method']:
+        if not versions:
+            break
+        old_apis, old_refs = load(versions[0], kind)
+        for old_version, new_version in zip(versions, versions[1:]):
+            new_apis, new_refs = load(new_version, kind)
+            if store is not None:
+                updates = store.api_updating(lib, old_version, new_version, kind)
+            else:
+                updates = api_updating(old_apis, new_apis, old_refs, new_refs)
+            deleted_apis, added_apis, modified_apis, outdated_apis = updates
+
+            save_dir = os.path.join(timeline_dir, f'{old_version}_{new_version}', kind)
+            os.makedirs(save_dir, exist_ok=True)
+            write2json(deleted_apis, os.path.join(save_dir, 'deleted-api.json'))
+            write2json(added_apis, os.path.join(save_dir, 'added-api.json'))
+            write2json(modified_apis['required_args'], os.path.join(save_dir, 'modified-api-A.json'))
+            write2json(outdated_apis['required_args'], os.path.join(save_dir, 'outdated-api-A.json'))
+            write2json(modified_apis['optional_args'], os.path.join(save_dir, 'modified-api-B.json'))
+            write2json(outdated_apis['optional_args'], os.path.join(save_dir, 'outdated-api-B.json'))
+
+            for change, apis in [('added', added_apis), ('deleted', deleted_apis),
+                                 ('required_args', modified_apis['required_args']),
+                                 ('optional_args', modified_apis['optional_args'])]:
+                for api in apis:
+                    timeline.record(kind, api['signature'].split('(', 1)[0], new_version, change)
+            old_apis, old_refs = new_apis, new_refs
+
+    if store is not None:
+        store.close()
+    timeline.save(os.path.join(timeline_dir, 'index.json'))
+    print(f'API timeline of {lib} over {len(versions)} releases has been recorded into {timeline_dir}.')
+    return timeline
+
+
+def api_timeline(lib, lib_name, versions, result_dir, mirror, archive_dir=None, cache_dir=None, max_workers=4,
+                 inspector_args=None, store_path=None, wheelhouse=None, package_cache_dir=None) -> APITimeline:
+    '''inspect each release exactly once, then diff consecutive releases'''
+    jobs = [(lib, lib_name, version) for version in versions]
+    errors = inspect_api_versions(jobs, result_dir, mirror, archive_dir, cache_dir, max_workers, inspector_args,
+                                  wheelhouse, package_cache_dir)
+    inspected_versions = [version for version in versions if errors[(lib, version)] is None]
+    if len(inspected_versions) < len(versions):
+        print(f'Skip releases of {lib} that failed to be inspected: {sorted(set(versions) - set(inspected_versions))}')
+    if store_path is not None:
+        with SignatureStore(store_path) as store:
+            for version in inspected_versions:
+                store.add_snapshot(lib, version, os.path.join(result_dir, lib, f'{lib}-{version}-api'))
+    return build_api_timeline(lib, inspected_versions, result_dir, store_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lib', type=str, required=True)
+    parser.add_argument('--lib_name', type=str, default=None)
+    parser.add_argument('--versions', type=str, nargs='+', required=True, help='Ordered releases, oldest first.')
+    parser.add_argument('--result_dir', type=str, required=True)
+    parser.add_argument('--query', type=str, nargs='*', default=[], help='APIs to look up in the timeline.')
+    args = parser.parse_args()
+
+    config = get_dataset_config()
+    os.makedirs(args.result_dir, exist_ok=True)
+    timeline = api_timeline(args.lib, args.lib_name or args.lib, args.versions, args.result_dir, config.mirror,
+                            archive_dir=config.archive_dir, cache_dir=config.snapshot_cache_dir,
+                            max_workers=config.env_workers, inspector_args=config.inspector_args,
+                            store_path=config.signature_store, wheelhouse=config.wheelhouse,
+                            package_cache_dir=config.package_cache_dir)
+    for api_name in args.query:
+        print(f'{api_name}: first changed in {timeline.first_change(api_name)}, history {timeline.changes(api_name)}')
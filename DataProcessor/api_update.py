@@ -1,28 +1,47 @@
 import os
 import sys
+import traceback
 import subprocess
 from typing import Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from util.path import path_search, write2json, json2list
 from hparams.get_config import get_dataset_config
 from DataProcessor.signature_mapping import compare_signature
+from DataProcessor.api_alias import match_renamed_apis
+from DataProcessor.static_signature import find_archive, extract_static_signatures, merge_signatures
+from DataProcessor.snapshot_cache import SnapshotCache, STATIC_INSPECTOR, runtime_inspector
+from DataProcessor.signature_store import SignatureStore
+from DataProcessor.wheelhouse import provision_venv, venv_python
 
 
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+VENV_ROOT_DIR = os.path.join(CURRENT_DIR, 'venv')
+PACKAGE_CACHE_DIR = os.path.join(VENV_ROOT_DIR, '.package_cache')
+SCRIPT_PATH = os.path.join(CURRENT_DIR, 'inspect_signature.py')
+
+
+def output_kwargs(log_file=None, capture=False):
+    '''redirect subprocess output into a per-job log file if given'''
+    if log_file is not None:
+        return {'stdout': log_file, 'stderr': subprocess.STDOUT}
+    return {'capture_output': True} if capture else {}
     
     
-def create_venv(venv_dir, lib, version, mirror=None):
+def create_venv(venv_dir, lib, version, mirror=None, log_file=None):
     '''create virtual environment for different version library'''
     print('-' * 40)
     try:
         cmd = ['conda', 'create', '--prefix', venv_dir, f'{lib}={version}', '-y']
         print(f'Creating virtual environment for {lib}={version}...')
-        subprocess.run(cmd, check=True, capture_output=True)
+        subprocess.run(cmd, check=True, **output_kwargs(log_file, capture=True))
         print(f"Virtual environment created at {venv_dir}")
     except subprocess.CalledProcessError as e:
         cmd = ['python', '-m', 'venv', venv_dir]
-        subprocess.run(cmd, check=True, capture_output=True)
-        install_pip_in_venv(venv_dir)
-        install_package_in_venv(venv_dir, lib, version, mirror)
+        subprocess.run(cmd, check=True, **output_kwargs(log_file, capture=True))
+        install_pip_in_venv(venv_dir, log_file)
+        install_package_in_venv(venv_dir, lib, version, mirror, log_file)
         print(f"Virtual environment created at {venv_dir}")
     except Exception as e:
         print("Failed to create virtual environment with conda. Trying with venv module...")
@@ -30,7 +49,7 @@ def create_venv(venv_dir, lib, version, mirror=None):
     finally:
         print('-' * 40)
 
-def install_pip_in_venv(venv_dir):
+def install_pip_in_venv(venv_dir, log_file=None):
     '''Install pip if it has not been installed'''
     
     if sys.platform == 'win32':
@@ -39,14 +58,14 @@ def install_pip_in_venv(venv_dir):
         python_executable = os.path.join(venv_dir, 'bin', 'python')
 
     try:
-        subprocess.check_call([python_executable, '-m', 'ensurepip', '--upgrade'])
-        subprocess.check_call([python_executable, '-m', 'pip', 'install', '--upgrade', 'pip'])
+        subprocess.check_call([python_executable, '-m', 'ensurepip', '--upgrade'], **output_kwargs(log_file))
+        subprocess.check_call([python_executable, '-m', 'pip', 'install', '--upgrade', 'pip'], **output_kwargs(log_file))
         print(f"pip has been installed and upgraded in virtual environment at {venv_dir}")
     except Exception as e:
         print(f"Unexpected error: {e}")
 
 
-def install_package_in_venv(venv_dir, lib,  version, mirror=None):
+def install_package_in_venv(venv_dir, lib,  version, mirror=None, log_file=None):
     '''install target library in virtual environment'''
 
     if sys.platform == 'win32':
@@ -56,12 +75,12 @@ def install_package_in_venv(venv_dir, lib,  version, mirror=None):
     
     try:
         if mirror is None:
-            subprocess.check_call([pip_path, 'install', f'{lib}=={version}'])
+            subprocess.check_call([pip_path, 'install', f'{lib}=={version}'], **output_kwargs(log_file))
         else:
-            subprocess.check_call([pip_path, 'install', f'{lib}=={version}', '-i', mirror])
+            subprocess.check_call([pip_path, 'install', f'{lib}=={version}', '-i', mirror], **output_kwargs(log_file))
         print(f'Package {lib} installed successfully!')
     except subprocess.CalledProcessError as e:
-        raise (f"Error installing package {lib}: {e}")
+        raise Exception(f"Error installing package {lib}: {e}")
 
 
 def delete_venv(venv_path):
@@ -78,8 +97,18 @@ def delete_venv(venv_path):
 
 
 
-def api_updating(old_apis: Dict, new_apis: Dict):
-    '''compare api signature from 2 different version'''
+def load_refs(snapshot_dir, kind) -> Dict[str, str]:
+    '''{spelling: key} of the {kind}_ref.json of a snapshot, empty for snapshots saved without one'''
+    path = os.path.join(snapshot_dir, f'{kind}_ref.json')
+    return json2list(path) if os.path.exists(path) else {}
+
+
+def api_updating(old_apis: Dict, new_apis: Dict, old_refs: Dict = None, new_refs: Dict = None):
+    '''
+    compare api signature from 2 different version
+    old_refs / new_refs: the *_ref.json of the versions, APIs whose key moved between them are compared
+    instead of being reported as deleted and added
+    '''
     deleted_apis = []
     added_apis = []
     modified_apis = {'required_args': [], 'optional_args': []}
@@ -89,16 +118,19 @@ def api_updating(old_apis: Dict, new_apis: Dict):
     new_apis_name = set(new_apis.keys())
     deleted_apis_name = old_apis_name - new_apis_name
     added_apis_name = new_apis_name - old_apis_name
+    renamed = match_renamed_apis(deleted_apis_name, old_refs or {}, added_apis_name, new_refs or {})
+    deleted_apis_name -= set(renamed)
+    added_apis_name -= set(renamed.values())
 
     for deleted_api_name in deleted_apis_name:
         deleted_apis.append(old_apis[deleted_api_name])
     for added_api_name in added_apis_name:
         added_apis.append(new_apis[added_api_name])
 
-    inte_apis_name = old_apis_name.intersection(new_apis_name)
-    for api_name in inte_apis_name:
-        old_api = old_apis[api_name]
-        new_api = new_apis[api_name]
+    inte_apis_name = [(api_name, api_name) for api_name in old_apis_name.intersection(new_apis_name)]
+    for old_api_name, new_api_name in inte_apis_name + list(renamed.items()):
+        old_api = old_apis[old_api_name]
+        new_api = new_apis[new_api_name]
         if old_api == new_api:
             continue
         res = compare_signature(old_api['signature'], new_api['signature'])
@@ -114,70 +146,144 @@ def api_updating(old_apis: Dict, new_apis: Dict):
     return deleted_apis, added_apis, modified_apis, outdated_apis
 
 
-def updating_api_information(lib, lib_name, old_version, new_version, result_dir, mirror, delete_venv_=False):
-    result_dir = os.path.join(result_dir, lib)
-    if not os.path.exists(result_dir):
-        os.mkdir(result_dir)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    venv_root_dir = os.path.join(current_dir, 'venv')
-    script_path = os.path.join(current_dir, 'inspect_signature.py')
-
-    def create_venv_pipeline(venv_dir, version):
-        if not os.path.exists(venv_dir):
-            create_venv(venv_dir, lib, version, mirror)
-            # install_pip_in_venv(venv_dir)
-            # install_package_in_venv(venv_dir, lib, version, mirror)
-        else:
-            print(f'Virtual environment: {venv_dir} already exists!')
-
-    # create venv
-    old_venv_dir = os.path.join(venv_root_dir, f'{lib}-{old_version}')
-    new_venv_dir = os.path.join(venv_root_dir, f'{lib}-{new_version}')
-    create_venv_pipeline(old_venv_dir, old_version)
-    create_venv_pipeline(new_venv_dir, new_version)
-
-    # run script in virtual environment
-    def run_script_in_venv(venv_dir, save_dir):
-        if not os.path.exists(venv_dir):
-            print(f'Virtual environment at {venv_dir} does not exist!')
+def create_venv_pipeline(venv_dir, lib, version, mirror, log_file=None, wheelhouse=None, package_cache_dir=None):
+    '''with a wheelhouse, the venv is provisioned offline from local wheels hardlinked out of a shared package cache'''
+    if not os.path.exists(venv_dir):
+        if wheelhouse is not None:
+            provision_venv(venv_dir, lib, version, wheelhouse, package_cache_dir or PACKAGE_CACHE_DIR, log_file)
             return
-        
-        if sys.platform == 'win32':
-            py_exe = os.path.join(venv_dir, "Scripts", "python.exe")
-        else:
-            py_exe = os.path.join(venv_dir, "bin", "python")
-        cmd = [py_exe, script_path, '--lib', lib_name, '--save_dir', save_dir]
-        
-        try:
-            subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as e:
-            if not sys.platform == 'win32':
-                cmd[0] = os.path.join(venv_dir, "bin", "activate")
-            subprocess.run(cmd, check=True)
-        except:
-            print(f"Error occurred: {e}")
-            print(f"Error output:\n{e.stderr}")
-            
+        create_venv(venv_dir, lib, version, mirror, log_file)
+        # install_pip_in_venv(venv_dir)
+        # install_package_in_venv(venv_dir, lib, version, mirror)
+    else:
+        print(f'Virtual environment: {venv_dir} already exists!')
+
+
+def venv_python_version(venv_dir):
+    '''major.minor of the interpreter of a venv, None if there is no venv'''
+    if not os.path.exists(venv_python(venv_dir)):
+        return None
+    output = subprocess.check_output([venv_python(venv_dir), '-c', "import sys; print('{}.{}'.format(*sys.version_info[:2]))"])
+    return output.decode('utf-8').strip()
+
+
+def run_script_in_venv(venv_dir, lib_name, save_dir, modules=None, log_file=None, inspector_args=None):
+    '''run inspect_signature.py in virtual environment'''
+    if not os.path.exists(venv_dir):
+        print(f'Virtual environment at {venv_dir} does not exist!')
+        return
+    
+    if sys.platform == 'win32':
+        py_exe = os.path.join(venv_dir, "Scripts", "python.exe")
+    else:
+        py_exe = os.path.join(venv_dir, "bin", "python")
+    cmd = [py_exe, SCRIPT_PATH, '--lib', lib_name, '--save_dir', save_dir]
+    if modules:
+        cmd += ['--modules'] + modules
+    cmd += inspector_args or []
+    
+    try:
+        subprocess.run(cmd, check=True, **output_kwargs(log_file))
+    except subprocess.CalledProcessError as e:
+        if log_file is not None:
+            # the output of the inspector went into the log of the job
+            raise Exception(f'{e} See {log_file.name} for the output of the inspector.') from e
+        raise
+
+
+def inspect_api_version(lib, lib_name, version, save_dir, mirror, archive_dir=None, cache_dir=None, log_file=None,
+                        inspector_args=None, wheelhouse=None, package_cache_dir=None):
+    '''collect API signatures of lib==version into save_dir, inspector_args are passed to inspect_signature.py'''
+    venv_dir = os.path.join(VENV_ROOT_DIR, f'{lib}-{version}')
+    cache = SnapshotCache(cache_dir) if cache_dir is not None else None
+    archive = find_archive(archive_dir, lib, version)
+    inspector = runtime_inspector(inspector_args) if archive is None else STATIC_INSPECTOR
+    # reuse a snapshot of an earlier run before touching any venv
+    if cache is not None and cache.restore(lib, version, save_dir, inspector=inspector):
+        print(f'Reuse cached API signatures of {lib}-{version}.')
+        return
+
+    if archive is None:
+        create_venv_pipeline(venv_dir, lib, version, mirror, log_file, wheelhouse, package_cache_dir)
+        run_script_in_venv(venv_dir, lib_name, save_dir, log_file=log_file, inspector_args=inspector_args)
+    else:
+        # read signatures from a local wheel / sdist without any venv, only compiled modules need a runtime inspection
+        compiled_modules = extract_static_signatures(archive, lib_name, save_dir)
+        if compiled_modules:
+            print(f'Inspecting {len(compiled_modules)} compiled modules of {lib}-{version} at runtime ...')
+            runtime_dir = f'{save_dir}-runtime'
+            create_venv_pipeline(venv_dir, lib, version, mirror, log_file, wheelhouse, package_cache_dir)
+            run_script_in_venv(venv_dir, lib_name, runtime_dir, compiled_modules, log_file, inspector_args)
+            merge_signatures(save_dir, runtime_dir)
+
+    if not all(os.path.exists(os.path.join(save_dir, f'{name}.json')) for name in ['function', 'method']):
+        raise Exception(f'No API signatures of {lib}-{version} were saved to {save_dir}')
+    if cache is not None:
+        cache.store(lib, version, save_dir, inspector=inspector, python_version=venv_python_version(venv_dir))
+
+
+def inspect_api_versions(jobs, result_dir, mirror, archive_dir=None, cache_dir=None, max_workers=4, inspector_args=None,
+                         wheelhouse=None, package_cache_dir=None):
+    '''
+    Provision environments and inspect API signatures for several (lib, lib_name, version) jobs concurrently.
+
+    Jobs run in a bounded thread pool, since the heavy work happens in conda / pip / inspector subprocesses.
+    Each job writes the output of its subprocesses into result_dir/{lib}/logs/{lib}-{version}.log,
+    and a failed job does not affect the others.
+
+    Returns:
+        dict: {(lib, version): None if succeeded, otherwise the raised exception}
+    '''
+    def run(lib, lib_name, version):
+        lib_dir = os.path.join(result_dir, lib)
+        log_dir = os.path.join(lib_dir, 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        save_dir = os.path.join(lib_dir, f'{lib}-{version}-api')
+        with open(os.path.join(log_dir, f'{lib}-{version}.log'), 'w', encoding='utf-8') as log_file:
+            try:
+                inspect_api_version(lib, lib_name, version, save_dir, mirror, archive_dir, cache_dir, log_file, inspector_args,
+                                    wheelhouse, package_cache_dir)
+            except Exception as e:
+                log_file.write(traceback.format_exc())
+                return e
+        return None
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, *job): job for job in dict.fromkeys(jobs)}
+        for future in as_completed(futures):
+            lib, _, version = futures[future]
+            error = future.result()
+            if error is None:
+                print(f'Finish processing library {lib}-{version} successfully!')
+            else:
+                print(f'Failed to process library {lib}-{version}: {error}\n'
+                      f'See {os.path.join(result_dir, lib, "logs", f"{lib}-{version}.log")} for details.')
+            results[(lib, version)] = error
+    return results
+
+
+def compare_api_versions(lib, old_version, new_version, result_dir, store=None):
+    '''
+    diff the saved signatures of 2 versions and record API updating information into result_dir/{lib},
+    with a SignatureStore the diff is computed by queries over the store instead of loading both snapshots
+    '''
+    result_dir = os.path.join(result_dir, lib)
     old_version_dir = os.path.join(result_dir, f'{lib}-{old_version}-api')
     new_version_dir = os.path.join(result_dir, f'{lib}-{new_version}-api')
-    run_script_in_venv(old_venv_dir, old_version_dir)
-    print(f'Finish processing library {lib}-{old_version} successfully!')
-    run_script_in_venv(new_venv_dir, new_version_dir)
-    print(f'Finish processing library {lib}-{new_version} successfully!')
-    print('-' * 40)
-
-    if delete_venv_:
-        delete_venv(old_venv_dir)
-        delete_venv(new_venv_dir)
 
     deleted_apis = {}
     added_apis = {}
     modified_apis = {}
     outdated_apis = {}
     def category(name):
-        old_apis = json2list(os.path.join(old_version_dir, f'{name}.json'))
-        new_apis = json2list(os.path.join(new_version_dir, f'{name}.json'))
-        deleted_apis[name], added_apis[name], modified_apis[name], outdated_apis[name] = api_updating(old_apis, new_apis)
+        if store is not None:
+            updates = store.api_updating(lib, old_version, new_version, name)
+        else:
+            old_apis = json2list(os.path.join(old_version_dir, f'{name}.json'))
+            new_apis = json2list(os.path.join(new_version_dir, f'{name}.json'))
+            updates = api_updating(old_apis, new_apis, load_refs(old_version_dir, name), load_refs(new_version_dir, name))
+        deleted_apis[name], added_apis[name], modified_apis[name], outdated_apis[name] = updates
         
         save_dir = os.path.join(result_dir, f'{name}')
         if not os.path.exists(save_dir):
@@ -197,6 +303,80 @@ def updating_api_information(lib, lib_name, old_version, new_version, result_dir
     return deleted_apis, added_apis, modified_apis, outdated_apis
 
 
+def updating_api_information(lib, lib_name, old_version, new_version, result_dir, mirror, delete_venv_=False, archive_dir=None,
+                             cache_dir=None, inspector_args=None, wheelhouse=None, package_cache_dir=None):
+    os.makedirs(os.path.join(result_dir, lib), exist_ok=True)
+    jobs = [(lib, lib_name, old_version), (lib, lib_name, new_version)]
+    errors = inspect_api_versions(jobs, result_dir, mirror, archive_dir, cache_dir, 2, inspector_args,
+                                  wheelhouse, package_cache_dir)
+    print('-' * 40)
+    for (_, version), error in errors.items():
+        if error is not None:
+            raise Exception(f'Failed to inspect {lib}-{version}: {error}')
+
+    if delete_venv_:
+        delete_venv(os.path.join(VENV_ROOT_DIR, f'{lib}-{old_version}'))
+        delete_venv(os.path.join(VENV_ROOT_DIR, f'{lib}-{new_version}'))
+
+    return compare_api_versions(lib, old_version, new_version, result_dir)
+
+
+def build_timeline(lib, versions, result_dir, store_path=None):
+    '''the timeline of the releases of lib that were inspected, a failure does not affect the first / last diff'''
+    # api_timeline imports this module
+    from DataProcessor.api_timeline import build_api_timeline
+    try:
+        build_api_timeline(lib, versions, result_dir, store_path)
+    except Exception as e:
+        print(f'Failed to build the API timeline of {lib}: {e}')
+
+
+def updating_api_information_batch(libs, lib_names, versions, result_dir, mirror, archive_dir=None, cache_dir=None,
+                                   max_workers=4, inspector_args=None, store_path=None, wheelhouse=None,
+                                   package_cache_dir=None):
+    '''
+    Step 1 for all libraries at once: every (lib, version) is inspected in one shared pool,
+    so the wall-clock time is set by the slowest library instead of the sum of all of them.
+    A library may list more than 2 releases (timeline mode), each of them is inspected once,
+    the first / last releases are compared here and the consecutive releases that were inspected are
+    diffed into the timeline of the library (see api_timeline.build_api_timeline).
+    If store_path is given, the inspected snapshots are imported into a SignatureStore and compared there.
+
+    Returns:
+        dict: {lib: (deleted_apis, added_apis, modified_apis, outdated_apis), or the exception if it failed}
+    '''
+    jobs = []
+    for lib, lib_name, lib_versions in zip(libs, lib_names, versions):
+        jobs += [(lib, lib_name, version) for version in lib_versions]
+    errors = inspect_api_versions(jobs, result_dir, mirror, archive_dir, cache_dir, max_workers, inspector_args,
+                                  wheelhouse, package_cache_dir)
+    print('-' * 40)
+
+    store = SignatureStore(store_path) if store_path is not None else None
+    if store is not None:
+        for (lib, version), error in errors.items():
+            if error is None:
+                store.add_snapshot(lib, version, os.path.join(result_dir, lib, f'{lib}-{version}-api'))
+
+    results = {}
+    for lib, lib_versions in zip(libs, versions):
+        if len(lib_versions) > 2:
+            build_timeline(lib, [version for version in lib_versions if errors[(lib, version)] is None],
+                           result_dir, store_path)
+        old_version, new_version = lib_versions[0], lib_versions[-1]
+        error = errors[(lib, old_version)] or errors[(lib, new_version)]
+        if error is not None:
+            results[lib] = error
+            continue
+        try:
+            results[lib] = compare_api_versions(lib, old_version, new_version, result_dir, store)
+        except Exception as e:
+            results[lib] = e
+    if store is not None:
+        store.close()
+    return results
+
+
 if __name__ == '__main__':
     config = get_dataset_config()
 
@@ -205,6 +385,11 @@ if __name__ == '__main__':
     if not os.path.exists(result_dir):
         os.mkdir(result_dir)
 
-    for lib, name, versions in zip(config.libs, config.lib_names, config.versions):
-        updating_api_information(lib, name, versions[0], versions[1], result_dir, config.mirror)
-
+    results = updating_api_information_batch(config.libs, config.lib_names, config.versions, result_dir, config.mirror,
+                                             archive_dir=config.archive_dir, cache_dir=config.snapshot_cache_dir,
+                                             max_workers=config.env_workers, inspector_args=config.inspector_args,
+                                             store_path=config.signature_store, wheelhouse=config.wheelhouse,
+                                             package_cache_dir=config.package_cache_dir)
+    for lib, res in results.items():
+        if isinstance(res, Exception):
+            print(f'Existing errors while porcessing library {lib}:\n{res}')
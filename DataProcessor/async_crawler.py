@@ -0,0 +1,412 @@
+"""
+asyncio engine of repo_crawler: the same queries, records and output files, but all requests go through one pooled
+keep-alive HTTP session with a global concurrency limit, several APIs are crawled at a time, and the next search page
+is requested while the files of the current page are still downloading.
+"""
+
+import os
+import base64
+import asyncio
+
+import aiohttp
+
+from DataProcessor import repo_crawler as crawler
+from DataProcessor.repo_crawler import generate_api_patterns, build_search_queries, save_code_snippets, crawl_targets, \
+    unique_items, split_api, restore_code_snippets
+from DataProcessor.usage_matcher import UsageMatcher
+from DataProcessor.crawl_journal import open_journal
+from DataProcessor.query_planner import GROUP, DIRECT, PER_PAGE, NEXT_PAGE, SPLIT, DONE, create_planner, next_step, \
+    split_query, is_shard
+from DataProcessor.token_scheduler import TokenScheduler, create_scheduler, endpoint_class, LOG_WAIT, MAX_RETRIES
+from DataProcessor.repo_cache import RepoMetadataCache, create_repo_cache
+from DataProcessor.blob_store import create_blob_store
+from DataProcessor.repo_clones import create_repo_clones
+from DataProcessor.http_cache import ResponseCache, cache_key, create_response_cache, load_json
+from DataProcessor import github_graphql
+
+
+
+SEARCH_URL = "https://api.github.com/search/code"
+
+
+class AsyncGitHubClient:
+    """
+    GitHub REST client over a single aiohttp session.
+    At most `concurrency` requests are in flight, and connections are kept alive and reused between them.
+    Tokens are handed out by a TokenScheduler, shared with any other crawler of the same process.
+    Repository details are looked up in a RepoMetadataCache first, then in batched GraphQL queries,
+    and file contents in the BlobStore (if any), then in the RepoClones (if any).
+    GET responses go through the ResponseCache (if any).
+    """
+    def __init__(self, tokens, concurrency=32, scheduler=None, repo_cache=None, blob_store=None, http_cache=None,
+                 clones=None):
+        self.scheduler = scheduler or TokenScheduler(tokens)
+        self.repo_cache = repo_cache or RepoMetadataCache()
+        self.blob_store = blob_store
+        self.http_cache = http_cache
+        self.clones = clones
+        self.file_tasks = {}
+        self.graphql = True
+        self.concurrency = concurrency
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             headers={"Accept": "application/vnd.github.v3+json"},
+                                             timeout=aiohttp.ClientTimeout(total=120))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def schedule(self, method, *args):
+        '''call a scheduler method, in a thread if it locks and rewrites a shared state file'''
+        if self.scheduler.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def acquire(self, endpoint):
+        while True:
+            token, wait = await self.schedule(self.scheduler.try_acquire, endpoint)
+            if token is not None:
+                return token
+            if wait >= LOG_WAIT:
+                print(f"\nAll tokens exhausted for {endpoint} requests, waiting {wait:.0f}s\n")
+            await asyncio.sleep(wait)
+
+    async def get_json(self, url, params=None):
+        '''GET url until it succeeds, return None if the request fails for another reason than rate limits'''
+        body, _ = await self.get_json_status(url, params)
+        return body
+
+    async def get_json_status(self, url, params=None):
+        '''(json body or None, status) of get_json, served from or revalidated against the ResponseCache if any'''
+        if self.http_cache is None:
+            return await self.request_json("GET", url, params=params)
+        key = cache_key(url, params)
+        entry = self.http_cache.lookup(key)
+        if entry is not None and entry['fresh']:
+            return load_json(entry['body']), 200
+        status, headers, content = await self.request("GET", url, params=params,
+                                                      headers=ResponseCache.conditional_headers(entry))
+        if status == 304 and entry is not None:
+            self.http_cache.touch(key)
+            return load_json(entry['body']), 200
+        if status != 200:
+            return None, status
+        self.http_cache.store(key, headers, content)
+        return load_json(content), status
+
+    async def request_json(self, method, url, params=None, payload=None):
+        '''(json body or None, status) of a request, retried as get_json'''
+        status, _, content = await self.request(method, url, params=params, payload=payload)
+        return (load_json(content) if status == 200 else None), status
+
+    async def request(self, method, url, params=None, payload=None, headers=None):
+        '''
+        (status, headers, raw body) of the first response that is neither rate-limited nor a server error,
+        retried as crawler.github_request
+        '''
+        endpoint = endpoint_class(url)
+        for attempt in range(MAX_RETRIES + 1):
+            async with self.semaphore:
+                # reserve quota only right before sending, not while queued behind the concurrency limit
+                token = await self.acquire(endpoint)
+                request_headers = {"Authorization": f"Bearer {token}", **(headers or {})}
+                try:
+                    async with self.session.request(method, url, params=params, json=payload,
+                                                    headers=request_headers) as response:
+                        status, response_headers = response.status, response.headers
+                        content = await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    await self.schedule(self.scheduler.release, token, endpoint)
+                    if attempt == MAX_RETRIES:
+                        raise
+                    continue
+            await self.schedule(self.scheduler.update, token, endpoint, status, response_headers)
+            retry = self.scheduler.is_rate_limited(status, response_headers) or status >= 500
+            if retry and attempt < MAX_RETRIES:
+                continue
+            return status, response_headers, content
+
+
+async def fetch_repository_details(client, repo_api_url):
+    async def request(url):
+        repo_data = await client.get_json(url)
+        if repo_data is None:
+            return 0, "Unknown"
+        return repo_data.get("stargazers_count", 0), repo_data.get("updated_at", "Unknown")
+
+    return await client.repo_cache.aget(repo_api_url, request)
+
+
+async def prefetch_repository_details(client, items):
+    '''the same as repo_crawler.prefetch_repository_details, the batches are sent concurrently'''
+    if not client.graphql:
+        return
+
+    async def resolve(batch):
+        full_names = [full_name for _, full_name in batch]
+        body, status = await client.request_json("POST", github_graphql.GRAPHQL_URL,
+                                                 payload={"query": github_graphql.repo_query(full_names)})
+        if github_graphql.is_rate_limited(body):
+            return
+        details = github_graphql.parse_repo_details(full_names, body)
+        if details is None:
+            if client.graphql:
+                print(f"GraphQL unavailable ({status}), fetching repository details by REST")
+            client.graphql = False
+            return
+        for repo_api_url, full_name in batch:
+            if full_name in details:
+                client.repo_cache.store(repo_api_url, *details[full_name])
+
+    await asyncio.gather(*(resolve(batch) for batch in github_graphql.batches(
+        github_graphql.uncached_repos(items, client.repo_cache))))
+
+
+async def prefetch_clones(client, items):
+    '''the same as repo_crawler.prefetch_clones, the checkouts run in threads'''
+    if client.clones is None:
+        return
+    await asyncio.gather(*(asyncio.to_thread(client.clones.checkout, full_name, paths)
+                           for full_name, paths in client.clones.hot_paths(items).items()))
+
+
+async def fetch_file_content(client, file_url, sha=None, repo=None, path=None):
+    '''a file requested by several APIs at once (results of a group query) is downloaded once'''
+    if client.blob_store is not None and sha:
+        code_content = client.blob_store.get(sha)
+        if code_content is not None:
+            return code_content
+    if client.clones is not None and repo:
+        code_content = client.clones.read(repo, path, sha)
+        if code_content is not None:
+            if client.blob_store is not None and sha:
+                client.blob_store.put(sha, code_content)
+            return code_content
+    task = client.file_tasks.get(file_url)
+    if task is None:
+        task = client.file_tasks[file_url] = asyncio.ensure_future(download_file_content(client, file_url, sha))
+        task.add_done_callback(lambda _: client.file_tasks.pop(file_url, None))
+    return await asyncio.shield(task)
+
+
+async def download_file_content(client, file_url, sha=None):
+    file_data = await client.get_json(file_url)
+    encoded_content = file_data.get("content", "") if file_data else ""
+    try:
+        code_content = base64.b64decode(encoded_content).decode("utf-8") if encoded_content else ""
+    except Exception as e:
+        print(f"Error decoding file content: {e}")
+        return ""
+    if client.blob_store is not None and sha and code_content:
+        client.blob_store.put(sha, code_content)
+    return code_content
+
+
+async def process_item(client, item, matcher=None):
+    '''
+    the same record as repo_crawler.process_item_for_parse, repository details and content are fetched together.
+    Files the UsageMatcher `matcher` does not match are dropped.
+    '''
+    repo_url = item["repository"]["html_url"]
+    (stars, last_updated), code_content = await asyncio.gather(
+        fetch_repository_details(client, item["repository"]["url"]),
+        fetch_file_content(client, item["url"], item.get("sha"), item["repository"]["full_name"], item["path"]))
+    if matcher is not None and not matcher.matches(code_content):
+        return None
+    if code_content:
+        return {
+            "code": code_content,
+            "repo_link": repo_url,
+            "file_url": repo_url + '/' + item["path"],
+            "last_updated": last_updated,
+            "stars": stars
+        }
+    return None
+
+
+async def parse_results(client, data, m, handled=None, on_item=None, matcher=None):
+    '''
+    fetch items in order until m snippets are collected, never more items than still needed are in flight.
+    handled and on_item as in repo_crawler.parse_results, matcher as in process_item
+    '''
+    items = unique_items(data.get("items", []))
+    if handled:
+        items = [item for item in items if item["url"] not in handled]
+    await asyncio.gather(prefetch_repository_details(client, items), prefetch_clones(client, items))
+    code_results = []
+    start = 0
+    while len(code_results) < m and start < len(items):
+        batch = items[start:start + m - len(code_results)]
+        start += len(batch)
+        results = await asyncio.gather(*(process_item(client, item, matcher) for item in batch))
+        if on_item is not None:
+            for item, result in zip(batch, results):
+                on_item(item, result)
+        code_results += [result for result in results if result]
+    return code_results
+
+
+async def fetch_code_snippets(client, planner, query, page, kind=DIRECT, counter_key=None):
+    '''the same search page as repo_crawler.fetch_code_snippets, concurrent requests of a group page are sent once'''
+    if kind == GROUP:
+        if not planner.group:
+            return {'total_count': 0, 'items': []}
+        task = planner.memo_get((query, page))
+        if task is None:
+            task = asyncio.ensure_future(search_page(client, planner, query, page, kind))
+            planner.memo_put((query, page), task)
+        result = await asyncio.shield(task)
+        if result is None:
+            # a failed page is searched again by the next member of the group
+            planner.memo_drop((query, page), task)
+        return result
+
+    all_results = await search_page(client, planner, query, page, kind)
+    if all_results is None:
+        return None
+    if counter_key is not None and page == 1 and not is_shard(query):
+        crawler.global_counts.setdefault(counter_key, 0)
+        crawler.global_counts[counter_key] += all_results["total_count"]
+    return all_results
+
+
+async def search_page(client, planner, query, page, kind):
+    planner.record_search(kind)
+    result, status = await client.get_json_status(SEARCH_URL, {"q": query, "per_page": PER_PAGE, "page": page})
+    if result is None:
+        print(f"Failed to fetch for query {query}: {status}")
+        if kind == GROUP and status == 422:
+            planner.disable_groups()
+            return {'total_count': 0, 'items': []}
+        return None
+    if client.clones is not None:
+        client.clones.count(result.get('items', []))
+    return {'total_count': result.get('total_count', 0), 'items': result.get('items', [])}
+
+
+async def crawl_api(client, planner, journal, api, names, root, m, usage_filter=True):
+    '''
+    crawl one API along the plan of the planner, with the same journal records as repo_crawler.repo_crawler.
+    usage_filter: drop files that do not use the API, results of group queries are always checked
+    '''
+    progress = journal.api_progress(api)
+    total_snippets = progress['snippets']
+    save_name, save_tail = split_api(api)
+    restore_code_snippets(save_name, total_snippets, root, save_tail)
+    seen_urls = set(s['file_url'] for s in total_snippets)
+    matcher = UsageMatcher([split_api(spelling)[0] for spelling in names])
+    for spelling in names:
+        if len(total_snippets) >= m:
+            break
+        if spelling in progress['names']:
+            continue
+        name, api_tail = split_api(spelling)
+        api_patterns = generate_api_patterns(name)
+        counter_key = api_patterns[0] + api_tail
+
+        plan = planner.plan(spelling, build_search_queries(api_patterns, api_tail))
+        while plan and len(total_snippets) < m:
+            kind, query = plan.pop(0)
+            if (spelling, query) in progress['queries']:
+                continue
+            if (spelling, query) in progress['splits']:
+                plan[:0] = [(kind, shard) for shard in progress['splits'][(spelling, query)]]
+                continue
+            page = progress['pages'].get((spelling, query), 0) + 1
+            next_page = asyncio.create_task(fetch_code_snippets(client, planner, query, page, kind, counter_key))
+            try:
+                while len(total_snippets) < m:
+                    data = await next_page
+                    next_page = None
+                    if data is None:
+                        # the query, spelling and API are left unfinished, the next crawl continues from this page
+                        print(f"Stopped API: {api} at a failed search, it is continued by the next crawl")
+                        return
+                    step = next_step(data, page, query)
+                    # prefetch the next page while the files of this one are downloading, if this page can not be enough
+                    if step == NEXT_PAGE and len(data['items']) < m - len(total_snippets):
+                        next_page = asyncio.create_task(
+                            fetch_code_snippets(client, planner, query, page + 1, kind, counter_key))
+
+                    def on_item(item, snippet):
+                        if snippet is not None and (snippet['file_url'] in seen_urls or len(total_snippets) >= m):
+                            snippet = None
+                        if snippet is not None:
+                            seen_urls.add(snippet['file_url'])
+                            save_code_snippets(save_name, [snippet], root, save_tail)
+                            planner.record_hit(kind)
+                        journal.finish_item(api, spelling, query, page, item['url'], snippet)
+
+                    await parse_results(client, data, min(m - len(total_snippets), len(data['items'])),
+                                        progress['items'], on_item,
+                                        matcher if usage_filter or kind == GROUP else None)
+                    journal.finish_page(api, spelling, query, page)
+                    if step == SPLIT:
+                        # a saturated query is crawled by its file size shards, each under the result cap
+                        shards = split_query(query)
+                        journal.split_query(api, spelling, query, shards)
+                        plan[:0] = [(kind, shard) for shard in shards]
+                        break
+                    if step == DONE:
+                        journal.finish_query(api, spelling, query)
+                        break
+                    if len(total_snippets) >= m:
+                        break
+                    if next_page is None:
+                        next_page = asyncio.create_task(
+                            fetch_code_snippets(client, planner, query, page + 1, kind, counter_key))
+                    page += 1
+            finally:
+                if next_page is not None:
+                    next_page.cancel()
+        journal.finish_name(api, spelling)
+
+    count = len(total_snippets)
+    journal.finish_api(api, count)
+    planner.save()
+    print(f"Saved {count} snippets for API: {api}")
+
+
+async def async_crawl(api_list, root, config, m=5, aliases=None):
+    concurrency = getattr(config, 'concurrency', 32)
+    journal = open_journal(root, config)
+    planner = create_planner(config)
+    targets = crawl_targets(api_list, aliases)
+    if crawler.function:
+        targets = planner.plan_targets(targets)
+    queue = asyncio.Queue()
+    for api, names in targets:
+        if journal.is_done(api):
+            print(f"Skip API: {api}, finished by a previous crawl")
+            continue
+        queue.put_nowait((api, names))
+
+    scheduler = create_scheduler(config.token, getattr(config, 'token_state_file', None))
+    repo_cache = create_repo_cache(config)
+    async with AsyncGitHubClient(config.token, concurrency, scheduler, repo_cache, create_blob_store(config),
+                                 create_response_cache(config), create_repo_clones(config)) as client:
+        async def worker():
+            while not queue.empty():
+                api, names = queue.get_nowait()
+                print(f"Processing API: {api}" + (f" (searched as {', '.join(names)})" if names != [api] else ""))
+                try:
+                    await crawl_api(client, planner, journal, api, names, root, m,
+                                    getattr(config, 'usage_filter', True))
+                except Exception as e:
+                    print(f"Failed to crawl API {api}: {e}")
+
+        # every API needs a few requests at a time, so fewer API workers than connections keep the pool busy
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency // 4))))
+    journal.close()
+
+
+def async_repo_crawler(api_list, root, config, m=5, aliases=None):
+    """Drop-in replacement of repo_crawler.repo_crawler running on asyncio."""
+    os.makedirs(root, exist_ok=True)
+    asyncio.run(async_crawl(api_list, root, config, m, aliases))
@@ -0,0 +1,50 @@
+import os
+import hashlib
+from typing import Optional
+
+from DataProcessor.wheelhouse import atomic_write
+
+
+
+def git_blob_sha(data: bytes) -> str:
+    '''the sha GitHub reports for a file of this content'''
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed store of downloaded source files, keyed by their git blob sha ({sha[:2]}/{sha}).
+
+    Search items carry the blob sha of the file, so a file is downloaded once and then read from disk for every
+    other query, API and run that finds it. Only content matching its sha is stored.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, sha):
+        return os.path.join(self.root, sha[:2], sha)
+
+    def get(self, sha) -> Optional[str]:
+        '''the stored content as downloaded, read as bytes so that CRLF line endings are kept'''
+        try:
+            with open(self.path(sha), 'rb') as f:
+                return f.read().decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+    def put(self, sha, content: str) -> bool:
+        data = content.encode('utf-8')
+        if git_blob_sha(data) != sha:
+            return False
+        path = self.path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, data)
+        return True
+
+
+def create_blob_store(config) -> Optional[BlobStore]:
+    '''the store of config.blob_store_dir, None if file contents are not stored'''
+    blob_store_dir = getattr(config, 'blob_store_dir', None)
+    return BlobStore(blob_store_dir) if blob_store_dir is not None else None
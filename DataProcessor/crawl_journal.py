@@ -0,0 +1,112 @@
+import os
+import json
+import threading
+from typing import Dict, Optional
+
+
+
+JOURNAL_NAME = 'crawl.journal'
+
+
+class CrawlJournal:
+    """
+    Append-only log of a crawl, one json record per line:
+        {"event": "item", "api", "name", "query", "page", "item": item url, "snippet": saved snippet or null}
+        {"event": "page", "api", "name", "query", "page"}    all items of the page are handled
+        {"event": "query", "api", "name", "query"}           the query has no more pages
+        {"event": "split", "api", "name", "query", "shards"} the query is saturated and replaced by its shards
+        {"event": "name", "api", "name"}                     all queries of the spelling `name` of api are done
+        {"event": "api", "api", "count"}                     api is finished, `count` snippets are saved
+    Replaying the log gives the exact state of an interrupted crawl, so a restart skips finished APIs by a set lookup
+    and continues the others from the next unhandled item. A torn last line of a killed run is dropped.
+    """
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.done = {}
+        self.progress = {}
+        self.lock = threading.Lock()
+        if not resume and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            self.replay()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def replay(self):
+        valid_size = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.apply(record)
+                valid_size += len(line)
+        if valid_size != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_size)
+
+    def api_progress(self, api) -> Dict:
+        '''
+        snippets saved so far, handled item urls, last handled page of each (spelling, query),
+        finished (spelling, query) pairs, shards of split (spelling, query) pairs and finished spellings
+        '''
+        return self.progress.setdefault(api, {'snippets': [], 'items': set(), 'pages': {}, 'queries': set(),
+                                              'splits': {}, 'names': set()})
+
+    def apply(self, record):
+        api, event = record['api'], record['event']
+        if event == 'api':
+            self.done[api] = record['count']
+            self.progress.pop(api, None)
+            return
+        progress = self.api_progress(api)
+        if event == 'item':
+            progress['items'].add(record['item'])
+            if record['snippet'] is not None:
+                progress['snippets'].append(record['snippet'])
+        elif event == 'page':
+            progress['pages'][(record['name'], record.get('query'))] = record['page']
+        elif event == 'query':
+            progress['queries'].add((record['name'], record['query']))
+        elif event == 'split':
+            progress['splits'][(record['name'], record['query'])] = record['shards']
+        elif event == 'name':
+            progress['names'].add(record['name'])
+
+    def append(self, record):
+        with self.lock:
+            self.apply(record)
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+
+    def is_done(self, api) -> bool:
+        return api in self.done
+
+    def finish_item(self, api, name, query, page, item_url, snippet: Optional[Dict]):
+        self.append({'event': 'item', 'api': api, 'name': name, 'query': query, 'page': page, 'item': item_url,
+                     'snippet': snippet})
+
+    def finish_page(self, api, name, query, page):
+        self.append({'event': 'page', 'api': api, 'name': name, 'query': query, 'page': page})
+
+    def finish_query(self, api, name, query):
+        self.append({'event': 'query', 'api': api, 'name': name, 'query': query})
+
+    def split_query(self, api, name, query, shards):
+        self.append({'event': 'split', 'api': api, 'name': name, 'query': query, 'shards': shards})
+
+    def finish_name(self, api, name):
+        self.append({'event': 'name', 'api': api, 'name': name})
+
+    def finish_api(self, api, count):
+        self.append({'event': 'api', 'api': api, 'count': count})
+
+    def close(self):
+        self.file.close()
+
+
+def open_journal(root, config) -> CrawlJournal:
+    '''the journal of the crawl into root, started afresh if config.resume_crawl is False'''
+    return CrawlJournal(os.path.join(root, JOURNAL_NAME), getattr(config, 'resume_crawl', True))
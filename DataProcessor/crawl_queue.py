@@ -0,0 +1,167 @@
+"""
+global crawl queue of repo_crawler: the function and method APIs of a crawl share one queue and one search budget.
+Every API is probed by its first search page, then the queue always continues the API expected to reach its
+m snippets in the fewest searches, by its snippets per search so far, so that the budget turns into as many usable
+APIs as possible.
+"""
+
+import os
+import heapq
+from typing import List, Tuple
+
+from DataProcessor import repo_crawler as crawler
+from DataProcessor.repo_crawler import setup_crawler, crawl_targets, crawl_api_steps
+from DataProcessor.crawl_journal import open_journal
+from DataProcessor.query_planner import PER_PAGE
+
+
+
+# progress is printed every STATS_EVERY searches
+STATS_EVERY = 20
+
+
+class CrawlTask:
+    """One API of the queue, its crawl_api_steps generator is resumed one search page at a time."""
+    def __init__(self, api, names, root, function, journal, m):
+        self.api = api
+        self.function = function
+        self.m = m
+        progress = journal.api_progress(api)
+        # shared with the generator, and kept after the journal drops the progress of the finished API
+        self.snippets = progress['snippets']
+        self.items = progress['items']
+        self.steps = crawl_api_steps(api, names, root, m, journal)
+        self.searches = 0
+        self.total_count = None
+        self.done = False
+
+    def step(self, totals=None) -> bool:
+        '''
+        fetch the next search page of the API and handle its files, False once the API is finished.
+        totals: the Acceptance of the crawl, its counts follow the snippets and items of the step
+        '''
+        crawler.function = self.function
+        searches = crawler.PLANNER.searches
+        snippets, items = len(self.snippets), len(self.items)
+        try:
+            data = next(self.steps)
+        except StopIteration:
+            self.done = True
+            return False
+        finally:
+            self.searches += crawler.PLANNER.searches - searches
+            if totals is not None:
+                totals.add(len(self.snippets) - snippets, len(self.items) - items)
+        if self.total_count is None:
+            self.total_count = data['total_count']
+        return True
+
+    def remaining_searches(self, acceptance) -> float:
+        '''
+        expected searches until the API has m snippets, by its snippets per search so far. The next page is taken
+        to hold min(total_count left, 100) items at the acceptance of the crawl, so that APIs whose hits are used up
+        rank behind those with pages left.
+        '''
+        need = self.m - len(self.snippets)
+        if need <= 0:
+            return 0.0
+        left = max((self.total_count or 0) - len(self.items), 0)
+        prior = acceptance * min(left, PER_PAGE)
+        rate = (len(self.snippets) + prior) / (self.searches + 1)
+        return need / max(rate, 1e-3)
+
+
+class Acceptance:
+    """Snippets saved per handled search item over all APIs, as running totals of the steps of the crawl."""
+    def __init__(self, tasks):
+        self.snippets = sum(len(task.snippets) for task in tasks)
+        self.items = sum(len(task.items) for task in tasks)
+
+    def add(self, snippets, items):
+        self.snippets += snippets
+        self.items += items
+
+    def rate(self) -> float:
+        return (self.snippets + 1) / (self.items + 2)
+
+
+def print_stats(tasks, m, budget):
+    searches = crawler.PLANNER.searches
+    reached = sum(len(task.snippets) >= m for task in tasks)
+    snippets = sum(len(task.snippets) for task in tasks)
+    print(f"[crawl queue] {searches}{f'/{budget}' if budget is not None else ''} searches, "
+          f"{reached}/{len(tasks)} APIs with {m} snippets ({reached / max(searches, 1):.3f} per search), "
+          f"{sum(task.done for task in tasks)} finished, {snippets} snippets")
+
+
+def queue_crawl(jobs: List[Tuple[List[str], str, bool]], config, m=5, aliases=None):
+    """
+    Crawl the APIs of all jobs, [(api_list, root, function)] with function False for method APIs, from one queue.
+    The crawl stops after config.search_budget searches (unlimited if None), unfinished APIs keep their journal
+    and are continued by the next crawl. Output files and journals are those of repo_crawler.repo_crawler.
+    """
+    setup_crawler(config)
+    budget = getattr(config, 'search_budget', None)
+    function = crawler.function
+    journals, tasks = [], []
+    for api_list, root, job_function in jobs:
+        os.makedirs(root, exist_ok=True)
+        journal = open_journal(root, config)
+        journals.append(journal)
+        crawler.function = job_function
+        targets = crawl_targets(api_list, aliases)
+        if job_function:
+            targets = crawler.PLANNER.plan_targets(targets)
+        for api, names in targets:
+            if journal.is_done(api):
+                print(f"Skip API: {api}, finished by a previous crawl")
+                continue
+            tasks.append(CrawlTask(api, names, root, job_function, journal, m))
+
+    def within_budget():
+        return budget is None or crawler.PLANNER.searches < budget
+
+    # probe every API by its first search page, in plan order so that group pages are shared
+    totals = Acceptance(tasks)
+    probed = []
+    for i, task in enumerate(tasks):
+        if not within_budget():
+            break
+        if task.step(totals):
+            probed.append(i)
+    accept_rate = totals.rate()
+    queue = [(tasks[i].remaining_searches(accept_rate), i) for i in probed]
+    heapq.heapify(queue)
+    print_stats(tasks, m, budget)
+
+    reported = crawler.PLANNER.searches
+    while queue and within_budget():
+        _, i = heapq.heappop(queue)
+        task = tasks[i]
+        # estimates move with the acceptance of the crawl, a stale one is queued again
+        estimate = task.remaining_searches(accept_rate)
+        if queue and estimate > queue[0][0]:
+            heapq.heappush(queue, (estimate, i))
+            continue
+        if task.step(totals):
+            accept_rate = totals.rate()
+            heapq.heappush(queue, (task.remaining_searches(accept_rate), i))
+        if crawler.PLANNER.searches - reported >= STATS_EVERY:
+            reported = crawler.PLANNER.searches
+            print_stats(tasks, m, budget)
+
+    # the budget is spent: APIs with m snippets are finished without another search, the others are left
+    for task in tasks:
+        if not task.done and len(task.snippets) >= task.m:
+            task.step()
+        if not task.done:
+            task.steps.close()
+    unfinished = sum(not task.done for task in tasks)
+    if unfinished:
+        print(f"Search budget of {budget} spent, {unfinished} APIs are continued by the next crawl")
+    print_stats(tasks, m, budget)
+
+    crawler.function = function
+    crawler.PLANNER.save()
+    for journal in journals:
+        journal.close()
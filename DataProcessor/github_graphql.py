@@ -0,0 +1,53 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+# repositories resolved by one query
+BATCH_SIZE = 100
+
+
+def uncached_repos(items, cache) -> Dict[str, str]:
+    '''{repository API url: owner/name} of the distinct repositories of search items that are not in cache'''
+    repos = {}
+    for item in items:
+        repo = item["repository"]
+        if repo["url"] not in repos and cache.lookup(repo["url"]) is None:
+            repos[repo["url"]] = repo["full_name"]
+    return repos
+
+
+def batches(repos: Dict[str, str], size=BATCH_SIZE) -> List[List[Tuple[str, str]]]:
+    repos = list(repos.items())
+    return [repos[i:i + size] for i in range(0, len(repos), size)]
+
+
+def repo_query(full_names) -> str:
+    '''one GraphQL query for the stars and last update of every repository, aliased r0, r1, ...'''
+    fields = []
+    for i, full_name in enumerate(full_names):
+        owner, name = full_name.split('/', 1)
+        fields.append(f'r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) '
+                      '{ stargazerCount updatedAt }')
+    return '{\n' + '\n'.join(fields) + '\n}'
+
+
+def is_rate_limited(body) -> bool:
+    return any(error.get('type') == 'RATE_LIMITED' for error in (body or {}).get('errors', []))
+
+
+def parse_repo_details(full_names, body) -> Optional[Dict[str, Tuple[int, str]]]:
+    '''
+    {owner/name: (stars, last_updated)} of a repo_query response, or None if the query failed as a whole.
+    Repositories that do not resolve (deleted, renamed, private) are left out, they are fetched by REST.
+    '''
+    data = (body or {}).get('data')
+    if data is None:
+        return None
+    details = {}
+    for i, full_name in enumerate(full_names):
+        repo = data.get(f'r{i}')
+        if repo:
+            details[full_name] = (repo.get('stargazerCount', 0), repo.get('updatedAt') or "Unknown")
+    return details
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlencode
+
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body BLOB NOT NULL,
+    stored REAL NOT NULL
+)
+'''
+
+
+def cache_key(url, params=None) -> str:
+    if not params:
+        return url
+    return f'{url}?{urlencode(sorted(params.items()))}'
+
+
+class ResponseCache:
+    """
+    Bodies of successful GET responses with their ETag / Last-Modified, kept in SQLite.
+
+    A response younger than `max_age` seconds is served without any request. An older one is revalidated with
+    If-None-Match / If-Modified-Since: GitHub answers 304 without charging the rate limit, and the cached body is used.
+    Thread-safe, one cache is shared by all crawler threads / coroutines and by later runs.
+    """
+    def __init__(self, db_path, max_age=86400):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.max_age = max_age
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(SCHEMA)
+        self.lock = threading.Lock()
+
+    def lookup(self, key) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute('SELECT etag, last_modified, body, stored FROM responses WHERE key = ?',
+                                    (key,)).fetchone()
+        if row is None:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'body': zlib.decompress(row[2]),
+                'fresh': time.time() - row[3] < self.max_age}
+
+    @staticmethod
+    def conditional_headers(entry) -> Dict[str, str]:
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, key, headers, body: bytes):
+        '''keep a 200 response, only if it can be revalidated later'''
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        if etag is None and last_modified is None:
+            return
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                              (key, etag, last_modified, zlib.compress(body), time.time()))
+
+    def touch(self, key):
+        '''the cached response has been revalidated (304)'''
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE responses SET stored = ? WHERE key = ?', (time.time(), key))
+
+    def close(self):
+        self.conn.close()
+
+
+def load_json(body: bytes):
+    return json.loads(body.decode('utf-8'))
+
+
+def create_response_cache(config) -> Optional[ResponseCache]:
+    '''the cache of config.http_cache_path, None if responses are not cached'''
+    http_cache_path = getattr(config, 'http_cache_path', None)
+    if http_cache_path is None:
+        return None
+    return ResponseCache(http_cache_path, getattr(config, 'http_cache_max_age', 86400))
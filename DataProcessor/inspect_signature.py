@@ -1,14 +1,115 @@
+import ast
 import inspect
 import os
 import json
-import re
+import time
+import fnmatch
+import pkgutil
 import importlib
+import importlib.util
+import multiprocessing
+from multiprocessing.connection import wait
 from typing import Any, Dict, Optional, List
 import argparse
 
 
 
-errot = 0
+# bump when the inspected output changes, cached snapshots of older versions become stale
+INSPECTOR_VERSION = '4'
+# private and test subpackages are not walked by default
+DEFAULT_EXCLUDE = ['*._*', '*.tests', '*.tests.*', '*.test', '*.test.*']
+
+
+def path_rank(path):
+    '''order spellings of the same API, public and short paths first'''
+    parts = path.split('.')
+    return (sum(part.startswith('_') for part in parts), len(parts), path)
+
+
+def format_arguments(args: ast.arguments, returns: Optional[ast.AST] = None) -> str:
+    """
+    format ast arguments the same way as str(inspect.signature(...)), e.g. (a, b: int = 1, *, c=None) -> int
+    """
+    def format_param(arg, default=None, prefix=''):
+        text = prefix + arg.arg
+        if arg.annotation is not None:
+            text += f': {ast.unparse(arg.annotation)}'
+            if default is not None:
+                text += f' = {ast.unparse(default)}'
+        elif default is not None:
+            text += f'={ast.unparse(default)}'
+        return text
+
+    positional = args.posonlyargs + args.args
+    defaults = [None] * (len(positional) - len(args.defaults)) + args.defaults
+    params = []
+    for i, (arg, default) in enumerate(zip(positional, defaults)):
+        params.append(format_param(arg, default))
+        if args.posonlyargs and i == len(args.posonlyargs) - 1:
+            params.append('/')
+    if args.vararg:
+        params.append(format_param(args.vararg, prefix='*'))
+    elif args.kwonlyargs:
+        params.append('*')
+    for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+        params.append(format_param(arg, default))
+    if args.kwarg:
+        params.append(format_param(args.kwarg, prefix='**'))
+
+    signature = f"({', '.join(params)})"
+    if returns is not None:
+        signature += f' -> {ast.unparse(returns)}'
+    return signature
+
+
+def find_pyi_paths(library_module) -> Dict[str, str]:
+    """
+    find stub files shipped with the library, {module name: path of .pyi}
+    """
+    pyi_paths = {}
+    for root_dir in getattr(library_module, '__path__', []):
+        for path, _, filenames in os.walk(root_dir):
+            for fname in filenames:
+                if not fname.endswith('.pyi'):
+                    continue
+                rel_path = os.path.relpath(os.path.join(path, fname[:-len('.pyi')]), root_dir)
+                parts = [library_module.__name__] + rel_path.split(os.sep)
+                if parts[-1] == '__init__':
+                    parts = parts[:-1]
+                pyi_paths['.'.join(parts)] = os.path.join(path, fname)
+    return pyi_paths
+
+
+def build_pyi_index(pyi_paths: Dict[str, str]) -> Dict[tuple, str]:
+    """
+    parse every stub file once, {(module, qualname): signature}
+    the first definition wins, which is the first @overload as well
+    """
+    index = {}
+
+    def visit(module_name, body, prefix=''):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                index.setdefault((module_name, prefix + node.name), format_arguments(node.args, node.returns))
+            elif isinstance(node, ast.ClassDef):
+                visit(module_name, node.body, f'{prefix}{node.name}.')
+            elif isinstance(node, ast.If):
+                # i.e. if sys.version_info >= (3, 8):
+                visit(module_name, node.body, prefix)
+                visit(module_name, node.orelse, prefix)
+
+    for module_name, pyi_path in pyi_paths.items():
+        if not os.path.exists(pyi_path):
+            continue
+        try:
+            with open(pyi_path, 'r', encoding='utf-8') as f:
+                tree = ast.parse(f.read())
+        except (SyntaxError, ValueError, UnicodeDecodeError) as e:
+            print(f"Error while parsing {pyi_path}: {str(e)}")
+            continue
+        visit(module_name, tree.body)
+    return index
+
 
 class APIInspector:
     def __init__(self, 
@@ -19,10 +120,21 @@ class APIInspector:
         self.library_module = library_module
         self.signatures = {
             'function': {},
-            'method': {}
+            'method': {},
+            'function_ref': {},     # public re-export paths of a function -> key in 'function'
+            'method_ref': {}        # other spellings of a method -> key in 'method'
         }
+        # class key (defining module + qualname) -> {'paths': public paths, 'methods': own methods, 'mro': library classes}
+        self.classes = {}
+        self.class_methods = {}
         self.visited_modules = set()
+        self.respect_all = False
         self.pyi_paths = pyi_paths or {}
+        # stubs are parsed once here instead of once per inspected function
+        self.pyi_index = build_pyi_index(self.pyi_paths)
+        self.pyi_qualnames = {}
+        for module_name, qualname in self.pyi_index:
+            self.pyi_qualnames.setdefault(qualname, []).append(module_name)
         
     def is_library_function(self, obj: Any) -> bool:
         """
@@ -50,68 +162,138 @@ class APIInspector:
                         obj.__module__.startswith(self.library_name))
         return is_class and has_lib_module
     
-    def get_signature_from_pyi(self, func: Any) -> Optional[str]:
-        if not hasattr(func, '__module__') or not hasattr(func, '__name__'):
+    def get_signature_from_pyi(self, func: Any, module_name=None, qualname=None) -> Optional[str]:
+        if not self.pyi_index:
             return None
-            
-        for pyi_path in self.pyi_paths.values():
-            if os.path.exists(pyi_path):
-                with open(pyi_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    func_name = func.__name__
-                    pattern = rf"def {func_name}\((.*?)\).*?:"
-                    match = re.search(pattern, content, re.DOTALL)
-                    if match:
-                        return f"({match.group(1)})"
+        module_name = module_name or getattr(func, '__module__', None)
+        qualname = qualname or getattr(func, '__qualname__', None) or getattr(func, '__name__', None)
+        if module_name is None or qualname is None:
+            return None
+
+        signature = self.pyi_index.get((module_name, qualname))
+        if signature is not None:
+            return signature
+        # builtins often report a __module__ different from their stub, e.g. torch.add is stubbed in torch._C._VariableFunctions,
+        # for builtins without a text signature fall back to the qualname, only if it is unambiguous
+        if getattr(func, '__text_signature__', None) is not None or \
+                not (inspect.isbuiltin(func) or inspect.ismethoddescriptor(func)):
+            return None
+        modules = self.pyi_qualnames.get(qualname, [])
+        if len(modules) == 1:
+            return self.pyi_index[(modules[0], qualname)]
         return None
     
     def get_function_signature(self, func: Any) -> str:
         """
         get signature of function
         """
+        # for functions implemented in C/C++
+        if hasattr(func, '__text_signature__') and func.__text_signature__ is not None:
+            return func.__text_signature__
         try:
-            # for functions implemented in C/C++
-            if hasattr(func, '__text_signature__') and func.__text_signature__ is not None:
-                return func.__text_signature__
-            
-            pyi_signature = self.get_signature_from_pyi(func)
-            if pyi_signature:
-                return pyi_signature
-            
             # try to leverage inspect tools
             sig = inspect.signature(func)
             return str(sig)
         except (ValueError, TypeError):
-            return None
+            # no signature at runtime, i.e. builtins, the stubs are the last resort
+            return self.get_signature_from_pyi(func)
     
-    def get_class_signature(self, class_module, module_path) -> List[str]:
-        sigs = {}
-        
-        methods = inspect.getmembers(class_module)
-        for method_name, method in methods:
-            if callable(method) and (method_name in ['__init__', '__call__'] 
-                                    or not method_name.startswith('_')):
-                
-                def get_method_signature() -> str:
-                    try:
-                        sig = inspect.signature(method)
-                        return str(sig)
-                    except (ValueError, TypeError):
-                        if hasattr(method, '__text_signature__') and method.__text_signature__:
-                            return method.__text_signature__
-                    except:
-                        global error
-                        error += 1
-                        
-                sig = get_method_signature()
-                if sig:
-                    sigs[f'{module_path}.{method_name}'] = {
-                        'signature': f'{module_path}.{method_name}{sig}',
-                        'doc': inspect.getdoc(method)
-                    }
-        return sigs
+    def get_method_signature(self, class_module, method_name, method) -> str:
+        try:
+            sig = inspect.signature(method)
+            return str(sig)
+        except (ValueError, TypeError):
+            if hasattr(method, '__text_signature__') and method.__text_signature__:
+                return method.__text_signature__
+            return self.get_signature_from_pyi(method, class_module.__module__,
+                                               f'{class_module.__qualname__}.{method_name}')
+        except Exception:
+            # i.e. descriptors whose signature lookup raises something else
+            return None
+
+    @staticmethod
+    def is_public_method(method_name):
+        return method_name in ['__init__', '__call__'] or not method_name.startswith('_')
+
+    @staticmethod
+    def class_key(class_module):
+        return f'{class_module.__module__}.{class_module.__qualname__}'
+
+    def get_own_methods(self, class_module) -> Dict[str, Dict]:
+        """
+        public methods defined in the class body itself, inherited ones are resolved through the MRO
+        """
+        key = self.class_key(class_module)
+        if key in self.class_methods:
+            return self.class_methods[key]
+        methods = {}
+        for method_name in list(vars(class_module)):
+            if not self.is_public_method(method_name):
+                continue
+            try:
+                # getattr binds classmethods, the same as inspect.getmembers does
+                method = getattr(class_module, method_name)
+            except Exception:
+                continue
+            if not callable(method):
+                continue
+            sig = self.get_method_signature(class_module, method_name, method)
+            if sig:
+                methods[method_name] = {'signature': sig, 'doc': inspect.getdoc(method)}
+        self.class_methods[key] = methods
+        return methods
+
+    def record_class(self, class_module, path):
+        """
+        remember the path a class is found under, each library class along its MRO is inspected only once
+        """
+        for klass in class_module.__mro__:
+            if not self.is_library_class(klass):
+                continue
+            key = self.class_key(klass)
+            if key not in self.classes:
+                self.classes[key] = {
+                    'paths': [],
+                    'methods': self.get_own_methods(klass),
+                    'mro': [self.class_key(base) for base in klass.__mro__ if self.is_library_class(base)],
+                }
+        paths = self.classes[self.class_key(class_module)]['paths']
+        if path not in paths:
+            paths.append(path)
+
+    def build_method_signatures(self):
+        """
+        store each method once, under the best public path of its defining class (or of a subclass if the
+        defining class is private), and every other spelling in 'method_ref', i.e.
+        torch.nn.Linear.to -> torch.nn.Module.to
+        """
+        # (defining class, method name) -> (paths of the defining class, paths of subclasses inheriting it)
+        spellings = {}
+        for key, entry in self.classes.items():
+            resolved = {}
+            for definer in entry['mro']:
+                for method_name in self.classes.get(definer, {}).get('methods', {}):
+                    resolved.setdefault(method_name, definer)
+            for method_name, definer in resolved.items():
+                own_paths, inherited_paths = spellings.setdefault((definer, method_name), ([], []))
+                (own_paths if definer == key else inherited_paths).extend(entry['paths'])
+
+        for (definer, method_name), (own_paths, inherited_paths) in sorted(spellings.items()):
+            paths = own_paths or inherited_paths
+            if not paths:
+                continue
+            canonical = f'{min(paths, key=path_rank)}.{method_name}'
+            method = self.classes[definer]['methods'][method_name]
+            self.signatures['method'][canonical] = {
+                'signature': canonical + method['signature'],
+                'doc': method['doc']
+            }
+            for path in own_paths + inherited_paths:
+                alias = f'{path}.{method_name}'
+                if alias != canonical:
+                    self.signatures['method_ref'][alias] = canonical
     
-    def inspect_module(self, module, module_path=""):
+    def inspect_module(self, module, module_path="", recursive=True):
         """
         traverse all modules recursively
         """
@@ -120,10 +302,13 @@ class APIInspector:
             return
         self.visited_modules.add(module_id)
         
+        public_names = getattr(module, '__all__', None) if self.respect_all else None
         for name, obj in inspect.getmembers(module):
             # skip private module
             if name.startswith('_'):
                 continue
+            if public_names is not None and name not in public_names:
+                continue
                 
             full_path = f"{module_path}.{name}" if module_path else name
             
@@ -136,12 +321,14 @@ class APIInspector:
                             'signature': qualified_name + signature,
                             'doc': inspect.getdoc(obj)
                         }
+                        if full_path != qualified_name:
+                            self.signatures['function_ref'][full_path] = qualified_name
              
                 elif self.is_library_class(obj):
-                    sigs = self.get_class_signature(obj, full_path)
-                    self.signatures['method'].update(sigs)
+                    self.record_class(obj, full_path)
              
-                elif (inspect.ismodule(obj) and 
+                elif (recursive and
+                      inspect.ismodule(obj) and 
                       hasattr(obj, '__name__') and 
                       obj.__name__.startswith(self.library_name)):
                     self.inspect_module(obj, full_path)
@@ -156,27 +343,206 @@ class APIInspector:
             with open(file_path, 'w', encoding='utf-8') as f:
                 json.dump(self.signatures[name], f, indent=4)
         
+        self.build_method_signatures()
         save('function')
         save('method')
+        save('function_ref')
+        save('method_ref')
         print(f"Decect Number of Signatures: {len(self.signatures['function']) + len(self.signatures['method'])}")
         print(f"API signature information saved to: {output_dir}")
     
     def inspect_library(self):
         self.inspect_module(self.library_module, self.library_name)
 
+    def inspect_modules(self, module_names):
+        """
+        inspect given submodules only, i.e. compiled modules skipped by the static extractor
+        """
+        for module_name in module_names:
+            try:
+                module = importlib.import_module(module_name)
+            except Exception as e:
+                print(f"Error while importing {module_name}: {str(e)}")
+                continue
+            self.inspect_module(module, module_name)
+
+    def inspect_library_parallel(self, workers, timeout=300, include=None, exclude=None, use_pyi=False):
+        """
+        inspect every submodule in its own worker process, a module that hangs or crashes on import is
+        killed after `timeout` seconds without stalling the others. Results are merged in module order,
+        so the output does not depend on scheduling.
+        """
+        modules = discover_submodules(self.library_name, include, exclude)
+        print(f'Inspecting {len(modules)} modules of {self.library_name} with {workers} workers ...')
+        results, failures = inspect_modules_in_pool(self.library_name, modules, workers, timeout,
+                                                    use_pyi, self.respect_all)
+        for module_name in sorted(results):
+            signatures, classes = results[module_name]
+            for kind, sigs in signatures.items():
+                for key, value in sigs.items():
+                    self.signatures[kind].setdefault(key, value)
+            for key, entry in classes.items():
+                merged = self.classes.setdefault(key, {'paths': [], 'methods': entry['methods'], 'mro': entry['mro']})
+                merged['paths'] += [path for path in entry['paths'] if path not in merged['paths']]
+        for module_name, reason in sorted(failures.items()):
+            print(f"Error while inspecting {module_name}: {reason}")
+
+
+def discover_submodules(library_name, include=None, exclude=None) -> List[str]:
+    """
+    list the library and its submodules from the file system, without importing them
+    include / exclude are glob patterns over dotted module names, e.g. torch.nn.* / *.tests
+    """
+    include = include or ['*']
+    exclude = DEFAULT_EXCLUDE if exclude is None else exclude
+    def matched(name, patterns):
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+    spec = importlib.util.find_spec(library_name)
+    if spec is None:
+        raise ImportError(f"Cannot find {library_name}")
+    modules = [library_name]
+
+    def walk(paths, prefix):
+        for info in pkgutil.iter_modules(paths, prefix):
+            # excluded packages are not descended into, included ones may sit below a package that is not included
+            if matched(info.name, exclude):
+                continue
+            if matched(info.name, include):
+                modules.append(info.name)
+            if info.ispkg:
+                walk([os.path.join(info.module_finder.path, info.name.rsplit('.', 1)[-1])], info.name + '.')
+
+    walk(spec.submodule_search_locations or [], library_name + '.')
+    return sorted(set(modules))
+
+
+def inspect_worker(library_name, use_pyi, respect_all, conn):
+    """
+    worker process: receive module names, send back (module_name, signatures, error),
+    or (None, None, error) once if the library itself can not be imported
+    """
+    try:
+        inspector = create_inspector(library_name, use_pyi)
+    except ImportError as e:
+        conn.send((None, None, str(e)))
+        return
+    inspector.respect_all = respect_all
+    while True:
+        module_name = conn.recv()
+        if module_name is None:
+            break
+        inspector.signatures = {'function': {}, 'method': {}, 'function_ref': {}, 'method_ref': {}}
+        inspector.classes = {}
+        try:
+            module = importlib.import_module(module_name)
+            inspector.inspect_module(module, module_name, recursive=False)
+            conn.send((module_name, (inspector.signatures, inspector.classes), None))
+        except Exception as e:
+            conn.send((module_name, None, f'{type(e).__name__}: {str(e)}'))
+
+
+def inspect_modules_in_pool(library_name, modules, workers, timeout=300, use_pyi=False, respect_all=False):
+    """
+    inspect modules in a pool of worker processes with a per-module timeout
+    a worker that times out or dies is killed and replaced, the pool is aborted with an ImportError
+    if the library itself can not be imported, since every module would fail the same way
+
+    Returns:
+        dict: {module_name: signatures} of inspected modules
+        dict: {module_name: reason} of failed modules
+    """
+    ctx = multiprocessing.get_context()
+    pending = list(modules)
+    results, failures = {}, {}
+
+    def spawn(slot):
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=inspect_worker, args=(library_name, use_pyi, respect_all, child_conn), daemon=True)
+        process.start()
+        child_conn.close()
+        slot.update({'process': process, 'conn': parent_conn, 'module': None, 'started': None})
+
+    def assign(slot):
+        slot['module'] = pending.pop(0) if pending else None
+        if slot['module'] is not None:
+            slot['started'] = time.time()
+            try:
+                slot['conn'].send(slot['module'])
+            except (BrokenPipeError, OSError):
+                # the worker is already gone, its connection reports EOF and it is replaced in the loop
+                pass
+
+    def restart(slot, reason):
+        failures[slot['module']] = reason
+        slot['process'].kill()
+        slot['process'].join()
+        spawn(slot)
+        assign(slot)
+
+    slots = [{} for _ in range(max(1, min(workers, len(pending))))]
+    try:
+        for slot in slots:
+            spawn(slot)
+            assign(slot)
+
+        while any(slot['module'] is not None for slot in slots):
+            busy = [slot for slot in slots if slot['module'] is not None]
+            deadline = min(slot['started'] for slot in busy) + timeout
+            ready = wait([slot['conn'] for slot in busy], timeout=max(0, deadline - time.time()))
+            for slot in busy:
+                if slot['conn'] in ready:
+                    try:
+                        module_name, signatures, error = slot['conn'].recv()
+                    except (EOFError, OSError):
+                        slot['process'].join(timeout=1)
+                        restart(slot, f'worker exited with code {slot["process"].exitcode}')
+                        continue
+                    if module_name is None:
+                        raise ImportError(error)
+                    if error is None:
+                        results[module_name] = signatures
+                    else:
+                        failures[module_name] = error
+                    assign(slot)
+                elif time.time() - slot['started'] > timeout:
+                    restart(slot, f'timeout after {timeout}s')
+    finally:
+        for slot in slots:
+            if not slot:
+                continue
+            try:
+                slot['conn'].send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            slot['process'].join(timeout=5)
+            if slot['process'].is_alive():
+                slot['process'].kill()
+    return results, failures
+
 
-def create_inspector(library_name):
+def create_inspector(library_name, use_pyi=False):
     try:
         library_module = importlib.import_module(library_name)
-        pyi_paths = {}
+        pyi_paths = find_pyi_paths(library_module) if use_pyi else {}
         
         return APIInspector(library_name, library_module, pyi_paths=pyi_paths)
     except ImportError as e:
         raise ImportError(f"Cannot import {library_name}: {str(e)}")
 
-def main(lib, save_dir):
-    inspector = create_inspector(lib)
-    inspector.inspect_library()
+def main(lib, save_dir, modules=None, use_pyi=False, workers=0, timeout=300, include=None, exclude=None, respect_all=True):
+    if workers > 0 and not modules:
+        # the library is only imported inside the workers
+        inspector = APIInspector(lib, None)
+        inspector.respect_all = respect_all
+        inspector.inspect_library_parallel(workers, timeout, include, exclude, use_pyi)
+    else:
+        inspector = create_inspector(lib, use_pyi)
+        inspector.respect_all = respect_all
+        if modules:
+            inspector.inspect_modules(modules)
+        else:
+            inspector.inspect_library()
     inspector.save_signatures(save_dir)
 
 
@@ -184,7 +550,19 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--lib", type=str, required=True)
     parser.add_argument("--save_dir", type=str, required=True)
+    parser.add_argument("--modules", type=str, nargs='*', default=None,
+                        help='Only inspect these submodules instead of walking the whole library.')
+    parser.add_argument("--use_pyi", action='store_true',
+                        help='Read signatures of C/C++ functions from the .pyi stubs shipped with the library.')
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help='Inspect submodules in this many processes, 0 walks the library recursively in this process.')
+    parser.add_argument("--timeout", type=float, default=300, help='Seconds allowed for each submodule.')
+    parser.add_argument("--include", type=str, nargs='*', default=None, help='Glob patterns of submodules to inspect.')
+    parser.add_argument("--exclude", type=str, nargs='*', default=None,
+                        help=f'Glob patterns of submodules to skip, default: {DEFAULT_EXCLUDE}.')
+    parser.add_argument("--ignore_all", action='store_true', help='Inspect public names missing from __all__ as well.')
     
     args = parser.parse_args()
-    main(args.lib, args.save_dir)
+    main(args.lib, args.save_dir, args.modules, args.use_pyi,
+         args.workers, args.timeout, args.include, args.exclude, not args.ignore_all)
     
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""
+local corpus engine of repo_crawler: instead of GitHub code search, scan code we already have on disk
+(directories of cloned repositories, JSONL or Parquet code dumps) in parallel processes,
+and save the same records into the same output files.
+"""
+
+import os
+import re
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from DataProcessor import repo_crawler as crawler
+from DataProcessor.repo_crawler import crawl_targets, split_api, restore_code_snippets, save_code_snippets
+from DataProcessor.usage_matcher import UsageMatcher, trie_pattern
+from DataProcessor.blob_store import git_blob_sha
+from DataProcessor.crawl_journal import open_journal
+
+
+
+# JSONL dumps are scanned in byte ranges of this size, so one large dump keeps every worker busy
+JSONL_CHUNK_SIZE = 64 * 1024 * 1024
+SCANNER = None
+
+
+def repo_roots(corpus_dir) -> List[str]:
+    '''the git work trees under corpus_dir, or its subdirectories if it has none'''
+    roots = []
+    for dirpath, dirnames, _ in os.walk(corpus_dir):
+        if '.git' in dirnames or os.path.isfile(os.path.join(dirpath, '.git')):
+            roots.append(dirpath)
+            dirnames.clear()
+    if roots:
+        return sorted(roots)
+    return sorted(os.path.join(corpus_dir, d) for d in os.listdir(corpus_dir)
+                  if os.path.isdir(os.path.join(corpus_dir, d)))
+
+
+def corpus_units(corpus) -> List[Tuple]:
+    '''
+    the units of work of the corpus paths, one per repository of a directory, one per byte range of a JSONL dump
+    and one per row group of a Parquet dump
+    '''
+    units = []
+    for path in corpus:
+        if not os.path.exists(path):
+            raise ValueError(f"Local corpus {path} does not exist")
+        if os.path.isdir(path):
+            units += [('repo', root, os.path.relpath(root, path).replace(os.sep, '/')) for root in repo_roots(path)]
+        elif path.endswith('.jsonl'):
+            size = os.path.getsize(path)
+            units += [('jsonl', path, start, min(start + JSONL_CHUNK_SIZE, size))
+                      for start in range(0, size, JSONL_CHUNK_SIZE)]
+        elif path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            units += [('parquet', path, i) for i in range(pq.ParquetFile(path).num_row_groups)]
+        else:
+            raise ValueError(f"Unknown local corpus {path}, expected a directory, .jsonl or .parquet file")
+    return units
+
+
+def repo_files(root, name):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != '.git')
+        for filename in sorted(filenames):
+            if not filename.endswith('.py'):
+                continue
+            file_path = os.path.join(dirpath, filename)
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except (UnicodeDecodeError, OSError):
+                continue
+            yield {'repository': name, 'path': os.path.relpath(file_path, root).replace(os.sep, '/'),
+                   'content': content}
+
+
+def jsonl_records(path, start, end):
+    '''records of the lines starting in [start, end), a line cut by start belongs to the previous range'''
+    with open(path, 'rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def parquet_records(path, row_group):
+    import pyarrow.parquet as pq
+    yield from pq.ParquetFile(path).read_row_group(row_group).to_pylist()
+
+
+def unit_records(unit):
+    if unit[0] == 'repo':
+        return repo_files(unit[1], unit[2])
+    if unit[0] == 'jsonl':
+        return jsonl_records(*unit[1:])
+    return parquet_records(*unit[1:])
+
+
+class CorpusScanner:
+    """
+    The UsageMatcher of every API, compiled once per worker process.
+    Every use of an API contains its last name segment, so one alternation of these names first picks the
+    few APIs a file can use at all, and only their matchers run on it.
+    """
+    def __init__(self, targets, function=True):
+        self.function = function
+        self.matchers = {}
+        self.leaves = {}
+        for api, names in targets:
+            constructors = []
+            for spelling in names:
+                constructor = spelling if function else spelling.rsplit('.', 1)[0]
+                constructors.append(constructor)
+                self.leaves.setdefault(constructor.rsplit('.', 1)[-1], set()).add(api)
+            self.matchers[api] = UsageMatcher(constructors)
+        self.prefilter = re.compile(rf'(?<!\w){trie_pattern(self.leaves)}(?!\w)')
+
+    def match(self, content) -> List[str]:
+        candidates = set()
+        for leaf in set(self.prefilter.findall(content)):
+            candidates |= self.leaves[leaf]
+        apis = []
+        for api in sorted(candidates):
+            # methods are searched as "Class" ".method", the method has to appear as well
+            if not self.function and f'.{api.rsplit(".", 1)[1]}' not in content:
+                continue
+            if self.matchers[api].matches(content):
+                apis.append(api)
+        return apis
+
+
+def init_worker(targets, function):
+    global SCANNER
+    SCANNER = CorpusScanner(targets, function)
+
+
+def scan_unit(unit) -> List[Tuple[List[str], Dict]]:
+    '''[(APIs used, record)] of the code files of a unit'''
+    found = []
+    for record in unit_records(unit):
+        content = record.get('content')
+        if not isinstance(content, str) or not content:
+            continue
+        apis = SCANNER.match(content)
+        if apis:
+            found.append((apis, record))
+    return found
+
+
+def load_metadata(path) -> Dict[str, Dict]:
+    '''{repository: {"repository": url, "stars": int, "last_updated": str}} of the sidecar file, {} if None'''
+    if path is None:
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def to_snippet(record, metadata) -> Dict:
+    '''a record of the corpus as a snippet of repo_crawler.parse_results, the sidecar metadata comes first'''
+    name = record.get('repository', '')
+    meta = metadata.get(name, {})
+    repo_link = meta.get('repository', name)
+    return {
+        "code": record['content'],
+        "repo_link": repo_link,
+        "file_url": record.get('url') or f"{repo_link}/{record.get('path', '')}",
+        "last_updated": meta.get('last_updated', record.get('last_updated', "Unknown")),
+        "stars": meta.get('stars', record.get('stars', 0))
+    }
+
+
+def local_repo_crawler(api_list, root, config, m=5, aliases=None):
+    """
+    Drop-in replacement of repo_crawler.repo_crawler over the local corpus of config.local_corpus.
+    The corpus is scanned once for all APIs by config.local_workers processes (all cores if None), files are
+    handed out in corpus order and identical files are kept once per API, until every API has m snippets.
+    """
+    corpus = getattr(config, 'local_corpus', None)
+    if not corpus:
+        raise ValueError("The local crawler backend needs local_corpus: directories of repositories, "
+                         ".jsonl or .parquet code dumps to scan")
+    corpus = [corpus] if isinstance(corpus, str) else list(corpus)
+    metadata = load_metadata(getattr(config, 'local_corpus_metadata', None))
+    os.makedirs(root, exist_ok=True)
+    journal = open_journal(root, config)
+
+    targets = [(api, names) for api, names in crawl_targets(api_list, aliases) if not journal.is_done(api)]
+    snippets = {api: [] for api, _ in targets}
+    seen = {api: set() for api, _ in targets}
+    for api in snippets:
+        # the local corpus is scanned in full on every run, unfinished APIs are rewritten from scratch
+        save_name, save_tail = split_api(api)
+        restore_code_snippets(save_name, [], root, save_tail)
+    if targets:
+        units = corpus_units(corpus)
+        print(f"Scanning {len(units)} units of the local corpus for {len(targets)} APIs")
+        executor = ProcessPoolExecutor(getattr(config, 'local_workers', None), initializer=init_worker,
+                                       initargs=(targets, crawler.function))
+        try:
+            for found in executor.map(scan_unit, units):
+                for apis, record in found:
+                    sha = git_blob_sha(record['content'].encode('utf-8'))
+                    for api in apis:
+                        if len(snippets[api]) >= m or sha in seen[api]:
+                            continue
+                        seen[api].add(sha)
+                        snippet = to_snippet(record, metadata)
+                        snippets[api].append(snippet)
+                        save_name, save_tail = split_api(api)
+                        save_code_snippets(save_name, [snippet], root, save_tail)
+                if all(len(saved) >= m for saved in snippets.values()):
+                    break
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    for api, found in snippets.items():
+        journal.finish_api(api, len(found))
+        print(f"Saved {len(found)} snippets for API: {api}")
+    journal.close()
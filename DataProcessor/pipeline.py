@@ -3,7 +3,8 @@ import re
 import shutil
 import argparse
 
-from DataProcessor.api_update import updating_api_information
+from DataProcessor.api_update import updating_api_information_batch
+from DataProcessor.api_alias import load_alias_index
 from DataProcessor.api_detector import api_detector
 from DataProcessor.repo_crawler import repo_crawler
 from DataProcessor.synthesis import synthesis_metadata, mcq_construct, cct_construct, ect_construct
@@ -44,14 +45,28 @@ def pipeline(crawling=False,                # crawl repos from GitHub
     modified_methods_list = []
     updated_apis_info = {}
     outdated_apis_info = {}
+    aliases = {}    # public spellings -> canonical APIs, consulted by the crawler and the detectors
     
-    for lib, lib_name, versions in zip(config.libs, config.lib_names, config.versions):
+    # all (lib, version) environments are provisioned and inspected concurrently
+    print('-' * 80)
+    print(f'Processing libraries: {config.libs} \nSearching API update pairs ...')
+    api_updates = updating_api_information_batch(config.libs, config.lib_names, config.versions, result_dir, config.mirror,
+                                                 archive_dir=config.archive_dir,
+                                                 cache_dir=config.snapshot_cache_dir,
+                                                 max_workers=config.env_workers,
+                                                 inspector_args=config.inspector_args,
+                                                 store_path=config.signature_store,
+                                                 wheelhouse=config.wheelhouse,
+                                                 package_cache_dir=config.package_cache_dir)
+    
+    for lib, versions in zip(config.libs, config.versions):
         try:
-            print('-' * 80) 
-            print(f'Processing library: {lib} \nSearching API update pairs ...')
-            old_version = versions[0]
-            new_version = versions[1]
-            deleted_apis, added_apis, modified_apis, outdated_apis = updating_api_information(lib, lib_name, old_version, new_version, result_dir, config.mirror)
+            if isinstance(api_updates[lib], Exception):
+                raise api_updates[lib]
+            deleted_apis, added_apis, modified_apis, outdated_apis = api_updates[lib]
+            aliases.update(load_alias_index(os.path.join(result_dir, lib, f'{lib}-{versions[-1]}-api')))
+            # timeline mode (more than 2 releases): the diffs of consecutive releases are recorded by
+            # updating_api_information_batch as well
                 
             modified_functions_dict[lib] = {
                                         'required_args': modified_apis['function']['required_args'], 
@@ -79,10 +94,10 @@ def pipeline(crawling=False,                # crawl repos from GitHub
                     api_name = item['signature'].split('(', 1)[0]
                     outdated_apis_info[api_name] = item
         
-            modified_functions_list += get_sigs(modified_functions_dict['required_args'],
-                                                modified_functions_dict['optional_args'])
-            modified_methods_list += get_sigs(modified_methods_dict['required_args'],
-                                              modified_methods_dict['optional_args'])
+            modified_functions_list += get_sigs(modified_functions_dict[lib]['required_args'],
+                                                modified_functions_dict[lib]['optional_args'])
+            modified_methods_list += get_sigs(modified_methods_dict[lib]['required_args'],
+                                              modified_methods_dict[lib]['optional_args'])
             get_info(modified_functions_dict[lib])
             get_info(modified_methods_dict[lib])
             
@@ -90,20 +105,37 @@ def pipeline(crawling=False,                # crawl repos from GitHub
             print(f'Existing errors while porcessing library {lib}:\n{e}')
     
     # crawl repos from GitHub, save raw data to config.raw_data_dir
-    if crawling:
+    if crawling and config.crawler_backend == 'sync' and config.global_queue:
+        from DataProcessor.crawl_queue import queue_crawl
+        print('-' * 80 + '\nCrawling API invocations for functions and methods from one queue..')
+        queue_crawl(
+            [(modified_functions_list, os.path.join(config.raw_data_dir, 'function'), True),
+             (modified_methods_list, os.path.join(config.raw_data_dir, 'method'), False)],
+            config=config,
+            aliases=aliases
+        )
+        print('-' * 40 + '\nFinish crawling repo API invocations successfully!')
+    elif crawling:
+        crawler = repo_crawler
+        if config.crawler_backend == 'async':
+            from DataProcessor.async_crawler import async_repo_crawler as crawler
+        elif config.crawler_backend == 'local':
+            from DataProcessor.local_corpus import local_repo_crawler as crawler
         print('-' * 80 + '\nCrawling API invocations for functions..')
         # repo_crawler(config, modified_functions_list, 'function')
-        repo_crawler(
+        crawler(
             modified_functions_list, 
             root=os.path.join(config.raw_data_dir, 'function'), 
-            config=config
+            config=config,
+            aliases=aliases
         )
         print('-' * 40 + '\nCrawling API invocations for methods..')
         # repo_crawler(config, modified_methods_list, 'method')
-        repo_crawler(
+        crawler(
             modified_methods_list, 
             root=os.path.join(config.raw_data_dir, 'method'), 
-            config=config
+            config=config,
+            aliases=aliases
         )
         print('-' * 40 + '\nFinish crawling repo API invocations successfully!')
     else:
@@ -117,7 +149,7 @@ def pipeline(crawling=False,                # crawl repos from GitHub
         
     if api_extractor:
         print('-' * 80 + '\nLocating API invocation statements and reorganize crawled data...')
-        api_detector(config)
+        api_detector(config, aliases)
         print('-' * 40 + '\nExtract target code snippet successfully!')
     else:
         print('Skip code snippet extracting step ...')
@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from DataProcessor.wheelhouse import atomic_write
+
+
+
+GROUP = 'group'
+DIRECT = 'direct'
+# GitHub code search accepts at most five AND / OR / NOT operators and 256 characters per query
+MAX_OR_TERMS = 6
+MAX_QUERY_LENGTH = 256
+# results beyond the first 1000 of a query are never returned
+MAX_RESULTS = 1000
+PER_PAGE = 100
+# files larger than 384 KB are not indexed by code search
+MAX_FILE_SIZE = 384 * 1024
+SIZE_QUALIFIER = re.compile(r' size:(\d+)\.\.(\d+)$')
+NEXT_PAGE, SPLIT, DONE = 'page', 'split', 'done'
+
+
+def has_next_page(data, page) -> bool:
+    return len(data['items']) >= PER_PAGE and page * PER_PAGE < min(data['total_count'], MAX_RESULTS)
+
+
+def is_shard(query) -> bool:
+    return SIZE_QUALIFIER.search(query) is not None
+
+
+def split_query(query) -> List[str]:
+    '''
+    the two disjoint file size shards of a query, split at the geometric mean of its size range, since file sizes
+    spread over orders of magnitude. [] if the query covers a single size already
+    '''
+    match = SIZE_QUALIFIER.search(query)
+    if match is None:
+        low, high = 0, MAX_FILE_SIZE
+    else:
+        query, low, high = query[:match.start()], int(match.group(1)), int(match.group(2))
+    if low >= high:
+        return []
+    mid = min(max(int((max(low, 1) * high) ** 0.5), low), high - 1)
+    return [f'{query} size:{low}..{mid}', f'{query} size:{mid + 1}..{high}']
+
+
+def next_step(data, page, query) -> str:
+    '''
+    how to go on after a page of a query: the next page, or SPLIT if the query has more results than code search
+    returns (saturated), so that its size shards are crawled instead, each under the cap, or DONE
+    '''
+    if not has_next_page(data, page):
+        return DONE
+    if page == 1 and data['total_count'] > MAX_RESULTS and split_query(query):
+        return SPLIT
+    return NEXT_PAGE
+
+
+def group_query(names) -> str:
+    return '(' + ' OR '.join(f'"{name}"' for name in names) + ') language:Python'
+
+
+def plan_groups(names: List[str]) -> Dict[str, str]:
+    '''
+    {name: OR query shared with the other names of its module}, i.e. torch.nn.functional.softmax and
+    torch.nn.functional.relu are searched together as ("torch.nn.functional.softmax" OR "torch.nn.functional.relu").
+    Groups are cut to the operator and length limits of the search syntax, names left alone get no group query.
+    '''
+    modules = {}
+    for name in names:
+        if '.' in name:
+            modules.setdefault(name.rsplit('.', 1)[0], []).append(name)
+
+    queries = {}
+    for members in modules.values():
+        group = []
+        for name in members + [None]:
+            if name is not None and len(group) < MAX_OR_TERMS and \
+                    len(group_query(group + [name])) <= MAX_QUERY_LENGTH:
+                group.append(name)
+                continue
+            if len(group) > 1:
+                queries.update({member: group_query(group) for member in group})
+            group = [name]
+    return queries
+
+
+class QueryPlanner:
+    """
+    Decide which code searches are issued for an API, and in which order.
+
+    - APIs of the same module are searched together by one OR query first (see plan_groups), whose pages are kept
+      in memory for the other members of the group, so one search serves up to six APIs.
+    - The queries of an API (the direct pattern, then import-as and from-import for each prefix split) are ordered
+      by their historical yield, snippets saved per search, recorded by query kind in `stats_path` across runs.
+    The crawler walks the plan query by query and stops as soon as the API has m snippets.
+    """
+    def __init__(self, stats_path=None, group=True, memo_size=64):
+        self.stats_path = stats_path
+        self.group = group
+        self.group_queries = {}
+        self.stats = {}
+        # searches sent by this run
+        self.searches = 0
+        self.lock = threading.Lock()
+        self.pages = OrderedDict()
+        self.memo_size = memo_size
+        if stats_path is not None and os.path.exists(stats_path):
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                self.stats = json.load(f)
+
+    def plan_targets(self, targets: List[Tuple[str, List[str]]]) -> List[Tuple[str, List[str]]]:
+        '''set the group queries of the targets (searched by their first spelling), members of a group are put next
+        to each other so that its pages are still in memory when the next member is crawled'''
+        if not self.group:
+            return targets
+        self.group_queries = plan_groups([names[0] for _, names in targets])
+        order = {}
+        for i, (_, names) in enumerate(targets):
+            order.setdefault(self.group_queries.get(names[0], names[0]), i)
+        return sorted(targets, key=lambda target: order[self.group_queries.get(target[1][0], target[1][0])])
+
+    def disable_groups(self):
+        '''the search endpoint rejected an OR query'''
+        if self.group:
+            print("OR queries are not accepted by code search, searching APIs one by one")
+        self.group = False
+
+    def score(self, kind) -> float:
+        searches, hits = self.stats.get(kind, [0, 0])
+        # kinds never tried rank as one hit in two searches
+        return (hits + 1) / (searches + 2)
+
+    def plan(self, spelling, labeled_queries: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        '''[(kind, query)] of a spelling, its group query first'''
+        with self.lock:
+            queries = sorted(labeled_queries, key=lambda query: -self.score(query[0]))
+        if self.group and spelling in self.group_queries:
+            queries.insert(0, (GROUP, self.group_queries[spelling]))
+        return queries
+
+    def record_search(self, kind):
+        with self.lock:
+            self.stats.setdefault(kind, [0, 0])[0] += 1
+            self.searches += 1
+
+    def record_hit(self, kind):
+        with self.lock:
+            self.stats.setdefault(kind, [0, 0])[1] += 1
+
+    def save(self):
+        if self.stats_path is None:
+            return
+        with self.lock:
+            data = json.dumps(self.stats, indent=4).encode('utf-8')
+        stats_dir = os.path.dirname(self.stats_path)
+        if stats_dir:
+            os.makedirs(stats_dir, exist_ok=True)
+        atomic_write(self.stats_path, data)
+
+    def memo_get(self, key):
+        with self.lock:
+            if key in self.pages:
+                self.pages.move_to_end(key)
+                return self.pages[key]
+        return None
+
+    def memo_put(self, key, value):
+        with self.lock:
+            self.pages[key] = value
+            while len(self.pages) > self.memo_size:
+                self.pages.popitem(last=False)
+
+    def memo_drop(self, key, value):
+        '''forget a page that could not be fetched, unless it was put again since'''
+        with self.lock:
+            if self.pages.get(key) is value:
+                del self.pages[key]
+
+
+def create_planner(config) -> QueryPlanner:
+    return QueryPlanner(getattr(config, 'query_stats_file', None), getattr(config, 'group_queries', True))
@@ -0,0 +1,118 @@
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional, Tuple
+
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS repos (
+    url TEXT PRIMARY KEY,
+    stars INTEGER NOT NULL,
+    last_updated TEXT NOT NULL,
+    fetched REAL NOT NULL
+)
+'''
+
+
+class RepoMetadataCache:
+    """
+    (stars, last_updated) of repositories keyed by their API url, kept in SQLite for `ttl_days`.
+
+    One cache is shared by all crawler threads / coroutines of a run and, with a db_path, by later runs.
+    Concurrent lookups of the same repository that miss the cache are collapsed into a single request:
+    the first caller fetches, the others wait for its result.
+    """
+    def __init__(self, db_path=None, ttl_days=7):
+        if db_path is not None:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+        self.ttl = ttl_days * 86400
+        self.conn = sqlite3.connect(db_path or ':memory:', check_same_thread=False)
+        self.conn.execute(SCHEMA)
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.inflight_async = {}
+
+    def lookup(self, url) -> Optional[Tuple[int, str]]:
+        with self.lock:
+            row = self.conn.execute('SELECT stars, last_updated, fetched FROM repos WHERE url = ?', (url,)).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return row[0], row[1]
+
+    def store(self, url, stars, last_updated):
+        if last_updated == "Unknown":
+            # failed lookups are retried next time
+            return
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO repos VALUES (?, ?, ?, ?)', (url, stars, last_updated, time.time()))
+
+    def get(self, url, fetch: Callable[[str], Tuple[int, str]]) -> Tuple[int, str]:
+        '''cached details of url, fetch(url) is called at most once at a time per repository'''
+        details = self.lookup(url)
+        if details is not None:
+            return details
+        with self.lock:
+            future = self.inflight.get(url)
+            owner = future is None
+            if owner:
+                future = self.inflight[url] = Future()
+        if not owner:
+            return future.result()
+        try:
+            details = fetch(url)
+            self.store(url, *details)
+            future.set_result(details)
+            return details
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(url, None)
+
+    async def aget(self, url, fetch) -> Tuple[int, str]:
+        '''the same as get, for coroutines: fetch(url) is awaited'''
+        while True:
+            details = self.lookup(url)
+            if details is not None:
+                return details
+            future = self.inflight_async.get(url)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the fetching coroutine was cancelled, not this one: fetch again
+
+        future = self.inflight_async[url] = asyncio.get_running_loop().create_future()
+        try:
+            details = await fetch(url)
+            self.store(url, *details)
+            future.set_result(details)
+            return details
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # nobody may be waiting, retrieve the exception to keep asyncio quiet
+            future.exception()
+            raise
+        finally:
+            self.inflight_async.pop(url, None)
+
+    def close(self):
+        self.conn.close()
+
+
+def create_repo_cache(config) -> RepoMetadataCache:
+    '''the cache of config.repo_cache_path, kept only in memory for this run if the path is None'''
+    return RepoMetadataCache(getattr(config, 'repo_cache_path', None), getattr(config, 'repo_cache_ttl_days', 7))
@@ -0,0 +1,131 @@
+import os
+import shutil
+import threading
+import subprocess
+from typing import Dict, List, Optional, Set
+
+from DataProcessor.blob_store import git_blob_sha
+
+
+
+CLONE_URL = 'https://github.com/{full_name}.git'
+
+
+def git(*args, cwd=None):
+    # paths of search items are taken literally, not as glob patterns
+    return subprocess.run(['git', '--literal-pathspecs', *args], cwd=cwd, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def git_error(e) -> str:
+    stderr = getattr(e, 'stderr', None)
+    return stderr.decode('utf-8', errors='ignore').strip() if stderr else str(e)
+
+
+class RepoClones:
+    """
+    Shallow clones of the repositories with many search hits.
+
+    Search items are counted by repository (distinct file paths). Once a repository reaches `threshold` hits,
+    it is cloned once with `git clone --depth 1 --filter=blob:none --no-checkout`, which fetches its tree only,
+    and the files of each search page are checked out together, one round trip for all their blobs,
+    instead of one contents API request per file. The clones under `root` are shared by all APIs of a run
+    and reused by later runs. Thread-safe, clones and checkouts of one repository are serialized.
+    """
+    def __init__(self, root, threshold, url_template=CLONE_URL):
+        self.root = root
+        self.threshold = threshold
+        self.url_template = url_template
+        self.hits: Dict[str, Set[str]] = {}
+        self.clones: Dict[str, Optional[str]] = {}
+        self.lock = threading.Lock()
+        self.repo_locks = {}
+        os.makedirs(root, exist_ok=True)
+
+    def count(self, items):
+        '''count the hits of a search page'''
+        with self.lock:
+            for item in items:
+                self.hits.setdefault(item["repository"]["full_name"], set()).add(item["path"])
+
+    def is_hot(self, full_name) -> bool:
+        with self.lock:
+            return len(self.hits.get(full_name, ())) >= self.threshold
+
+    def repo_lock(self, full_name):
+        with self.lock:
+            return self.repo_locks.setdefault(full_name, threading.Lock())
+
+    def clone(self, full_name) -> Optional[str]:
+        '''the work tree of the clone, None if the repository can not be cloned'''
+        with self.repo_lock(full_name):
+            if full_name in self.clones:
+                return self.clones[full_name]
+            directory = os.path.join(self.root, full_name)
+            if not os.path.isdir(os.path.join(directory, '.git')):
+                partial = directory + '.partial'
+                shutil.rmtree(partial, ignore_errors=True)
+                os.makedirs(os.path.dirname(partial), exist_ok=True)
+                try:
+                    git('clone', '--quiet', '--depth', '1', '--filter=blob:none', '--no-checkout',
+                        self.url_template.format(full_name=full_name), partial)
+                    os.replace(partial, directory)
+                except (subprocess.CalledProcessError, OSError) as e:
+                    print(f"Failed to clone {full_name}: {git_error(e)}")
+                    shutil.rmtree(partial, ignore_errors=True)
+                    directory = None
+            self.clones[full_name] = directory
+            return directory
+
+    def checkout(self, full_name, paths: List[str]):
+        '''check out the paths of a hot repository that are not in its work tree yet'''
+        directory = self.clone(full_name)
+        if directory is None:
+            return
+        with self.repo_lock(full_name):
+            missing = [path for path in paths if not os.path.isfile(os.path.join(directory, path))]
+            if not missing:
+                return
+            try:
+                # paths not in the cloned HEAD any more would fail the checkout
+                listed = git('ls-tree', '-r', '-z', '--name-only', 'HEAD', '--', *missing, cwd=directory).stdout
+                existing = [path for path in listed.decode('utf-8').split('\0') if path]
+                if existing:
+                    git('checkout', '--quiet', 'HEAD', '--', *existing, cwd=directory)
+            except (subprocess.CalledProcessError, OSError) as e:
+                print(f"Failed to check out files of {full_name}: {git_error(e)}")
+
+    def read(self, full_name, path, sha=None) -> Optional[str]:
+        '''the checked out file, None if it is not checked out or differs from the blob sha of the search item'''
+        directory = self.clones.get(full_name)
+        if directory is None:
+            return None
+        try:
+            with open(os.path.join(directory, path), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if sha and git_blob_sha(data) != sha:
+            return None
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    def hot_paths(self, items) -> Dict[str, List[str]]:
+        '''{repository: paths} of the items of hot repositories'''
+        paths = {}
+        for item in items:
+            full_name = item["repository"]["full_name"]
+            if self.is_hot(full_name):
+                paths.setdefault(full_name, []).append(item["path"])
+        return paths
+
+
+def create_repo_clones(config) -> Optional[RepoClones]:
+    '''the clones of config.clone_dir, None if config.clone_threshold is None (every file is downloaded)'''
+    threshold = getattr(config, 'clone_threshold', None)
+    if threshold is None:
+        return None
+    return RepoClones(getattr(config, 'clone_dir', 'CodeSync/Crawl_Cache/clones'), threshold,
+                      getattr(config, 'clone_url', CLONE_URL))
@@ -1,13 +1,23 @@
 """根据三个文件爬取对应的github源码, step1"""
 
 import os
-import re
-import time
 import base64
 import requests
 import json
 from concurrent.futures import ThreadPoolExecutor
 
+from DataProcessor.api_alias import api_spellings, public_spellings
+from DataProcessor.token_scheduler import create_scheduler, endpoint_class, MAX_RETRIES
+from DataProcessor.repo_cache import create_repo_cache
+from DataProcessor.blob_store import create_blob_store
+from DataProcessor.repo_clones import create_repo_clones
+from DataProcessor.http_cache import ResponseCache, cache_key, create_response_cache
+from DataProcessor.crawl_journal import open_journal
+from DataProcessor.usage_matcher import UsageMatcher
+from DataProcessor.query_planner import GROUP, DIRECT, PER_PAGE, NEXT_PAGE, SPLIT, DONE, create_planner, next_step, \
+    split_query, is_shard
+from DataProcessor import github_graphql
+
 
 
 function = True
@@ -15,29 +25,76 @@ global_counts = {}
 STAR_LIMIT = 0
 MOUNT = 500
 tokens = []
-CUR = 0
-def try1():
+SCHEDULER = None
+REPO_CACHE = None
+BLOB_STORE = None
+HTTP_CACHE = None
+CLONES = None
+PLANNER = None
+# drop fetched files that do not use the API, results of group queries are always checked
+USAGE_FILTER = True
+# switched off once GraphQL turns out to be unavailable, i.e. for tokens without GraphQL access
+GRAPHQL = True
+SESSION = requests.Session()
+
+
+def github_get(url, params=None):
     """
-    尝试目前是否达到了GitHub的爬取上限
+    GET a GitHub API url with the token of most headroom, see token_scheduler.TokenScheduler.
+    Rate-limited responses, server and network errors are retried up to MAX_RETRIES times, then the last response
+    is returned, or the network error raised. Any other response is returned.
+    With HTTP_CACHE set, fresh responses are served from it and stale ones are revalidated by conditional requests.
     """
-    base_url = 'https://api.github.com/search/code'
-    headers = {
-        "Authorization": f"Bearer {tokens[CUR]}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-    params ={
-            "q": '"pandas.core.dtypes.cast.infer_dtype_from_scalar" language:Python',
-            "per_page": 100,
-            "page": 1,
+    if HTTP_CACHE is None:
+        return github_request("GET", url, params=params)
+    key = cache_key(url, params)
+    entry = HTTP_CACHE.lookup(key)
+    if entry is not None and entry['fresh']:
+        return cached_response(url, entry['body'])
+    response = github_request("GET", url, params=params, headers=ResponseCache.conditional_headers(entry))
+    if response.status_code == 304 and entry is not None:
+        HTTP_CACHE.touch(key)
+        return cached_response(url, entry['body'])
+    if response.status_code == 200:
+        HTTP_CACHE.store(key, response.headers, response.content)
+    return response
+
+
+def cached_response(url, body):
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = body
+    response.encoding = "utf-8"
+    return response
+
+
+def github_post(url, payload):
+    """POST a json payload (i.e. a GraphQL query), retried as github_get."""
+    return github_request("POST", url, payload=payload)
+
+
+def github_request(method, url, params=None, payload=None, headers=None):
+    endpoint = endpoint_class(url)
+    for attempt in range(MAX_RETRIES + 1):
+        token = SCHEDULER.acquire(endpoint)
+        request_headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github.v3+json",
+            **(headers or {}),
         }
-    while True:
-        try: 
-            response = requests.get(base_url, headers=headers, params=params)
-            break
-        except:
+        try:
+            response = SESSION.request(method, url, headers=request_headers, params=params, json=payload)
+        except requests.RequestException:
+            SCHEDULER.release(token, endpoint)
+            if attempt == MAX_RETRIES:
+                raise
             continue
-    if response.status_code == 200:
-        return True
+        SCHEDULER.update(token, endpoint, response.status_code, response.headers)
+        retry = SCHEDULER.is_rate_limited(response.status_code, response.headers) or response.status_code >= 500
+        if retry and attempt < MAX_RETRIES:
+            continue
+        return response
     
 
 def generate_api_patterns(api_name):
@@ -78,27 +135,14 @@ def generate_api_patterns(api_name):
 
 
 def fetch_repository_details(repo_api_url):
-    global CUR
-    """Fetch repository details such as stars and last updated time."""
-    while True:
-        while True:
-            try:
-                response = requests.get(repo_api_url, headers={"Authorization": f"Bearer {tokens[CUR]}"})
-                break
-            except:
-                continue
-        if response.status_code == 200:
-            break
-        else:
-            CUR += 1
-            CUR %= len(tokens)
-            if CUR == 0:
-                while True:
-                    if try1(): break
-                    else: 
-                        print("\nwaiting 100s\n")
-                        time.sleep(100)
-            
+    """Fetch repository details such as stars and last updated time, through REPO_CACHE if one is set."""
+    if REPO_CACHE is not None:
+        return REPO_CACHE.get(repo_api_url, request_repository_details)
+    return request_repository_details(repo_api_url)
+
+
+def request_repository_details(repo_api_url):
+    response = github_get(repo_api_url)
     if response.status_code == 200:
         repo_data = response.json()
         stars = repo_data.get("stargazers_count", 0)
@@ -109,27 +153,25 @@ def fetch_repository_details(repo_api_url):
     return stars, last_updated
 
 
-def fetch_file_content(file_url):
-    global CUR
-    """Fetch file content from GitHub API."""
-    while True:
-        while True:
-            try:
-                response = requests.get(file_url, headers={"Authorization": f"Bearer {tokens[CUR]}"})
-                break
-            except:
-                continue
-        if response.status_code == 200:
-            break
-        else:
-            CUR += 1
-            CUR %= len(tokens)
-            if CUR == 0:
-                while True:
-                    if try1(): break
-                    else: 
-                        print("\nwaiting 100s\n")
-                        time.sleep(100)
+def fetch_file_content(file_url, sha=None, repo=None, path=None):
+    """
+    Fetch file content from GitHub API, or from BLOB_STORE if the blob sha has been downloaded before,
+    or from the checkout of the repository (full name `repo`) in CLONES.
+    """
+    if BLOB_STORE is not None and sha:
+        code_content = BLOB_STORE.get(sha)
+        if code_content is not None:
+            return code_content
+    code_content = CLONES.read(repo, path, sha) if CLONES is not None and repo else None
+    if code_content is None:
+        code_content = download_file_content(file_url)
+    if BLOB_STORE is not None and sha and code_content:
+        BLOB_STORE.put(sha, code_content)
+    return code_content
+
+
+def download_file_content(file_url):
+    response = github_get(file_url)
     if response.status_code == 200:
         file_data = response.json()
         encoded_content = file_data.get("content", "")
@@ -144,63 +186,65 @@ def fetch_file_content(file_url):
 
 def check_api_usage(code_content, patterns):
     """
-    检查代码中是否包含API的任何使用模式
-    需要检查import语句和实际使用
-    支持任意别名的导入匹配
+    检查代码中是否使用了API (直接调用, import as 别名或 from import), patterns 为 generate_api_patterns 的结果.
+    批量检查同一个API的文件时应只构建一次 UsageMatcher
     """
-    if not code_content:
-        return False
-        
-    # 将代码分割成行
-    lines = code_content.split('\n')
-    
-    # 将模式分组为不同类型
-    import_as_patterns = [p for p in patterns if p.startswith('import') and 'as' in p]
-    from_import_patterns = [p for p in patterns if p.startswith('from')]
-    usage_patterns = [p for p in patterns if not p.startswith(('import', 'from'))]
-    
-    # 对于直接匹配模式（第一个模式），只需要找到一个就可以
-    found_direct = any(re.search(rf'\b{re.escape(patterns[0])}\b', line) 
-                      for line in lines)
-    
-    if found_direct:
-        return True
-    
-    # 检查 from import 模式
-    found_from_import = False
-    for from_pattern in from_import_patterns:
-        if any(re.search(rf'\b{re.escape(from_pattern)}\b', line) for line in lines):
-            found_from_import = True
-            break
-            
-    if found_from_import:
-        # 如果找到了from import语句，检查对应的使用模式
-        for usage_pattern in usage_patterns:
-            if any(re.search(rf'\b{re.escape(usage_pattern)}\b', line) for line in lines):
-                return True
-    
-    # 检查 import as 模式
-    # 首先找到所有import as语句
-    import_lines = [line for line in lines if any(line.startswith(pattern.split(' as')[0]) 
-                   and 'as' in line for pattern in import_as_patterns)]
-    
-    for import_line in import_lines:
-        # 从import语句中提取别名
-        match = re.search(r'import\s+(.+)\s+as\s+(\w+)', import_line)
-        if match:
-            imported_path, alias = match.groups()
-            # 检查是否有对应的使用模式
-            for usage_pattern in usage_patterns:
-                # 构建实际使用模式（使用提取的别名）
-                actual_usage = f'{alias}.{usage_pattern}'
-                if any(re.search(rf'\b{re.escape(actual_usage)}\b', line) for line in lines):
-                    return True
-    
-    return False
+    return UsageMatcher([patterns[0]]).matches(code_content)
+
+
+def prefetch_repository_details(items):
+    """
+    Resolve the distinct repositories of a search page that are not in REPO_CACHE with batched GraphQL queries,
+    up to 100 repositories per request. Whatever is left unresolved is fetched by REST in process_item_for_parse.
+    """
+    global GRAPHQL
+    if not GRAPHQL or REPO_CACHE is None:
+        return
+    for batch in github_graphql.batches(github_graphql.uncached_repos(items, REPO_CACHE)):
+        full_names = [full_name for _, full_name in batch]
+        response = github_post(github_graphql.GRAPHQL_URL, {"query": github_graphql.repo_query(full_names)})
+        body = response.json() if response.status_code == 200 else None
+        if github_graphql.is_rate_limited(body):
+            return
+        details = github_graphql.parse_repo_details(full_names, body)
+        if details is None:
+            print(f"GraphQL unavailable ({response.status_code}), fetching repository details by REST")
+            GRAPHQL = False
+            return
+        for repo_api_url, full_name in batch:
+            if full_name in details:
+                REPO_CACHE.store(repo_api_url, *details[full_name])
+
+
+def prefetch_clones(items):
+    """Check out the files of a search page that belong to repositories with many hits, one checkout per repository."""
+    if CLONES is None:
+        return
+    hot_paths = CLONES.hot_paths(items)
+    if hot_paths:
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(CLONES.checkout, hot_paths.keys(), hot_paths.values()))
+
+
+def unique_items(items):
+    """
+    Collapse the items of a search page that point to the same file content: the same file found by several queries,
+    and copies of a file in other repositories (forks, vendored code). The first item of each blob is kept.
+    """
+    seen, unique = set(), []
+    for item in items:
+        key = item.get("sha") or item["url"]
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
 
 
-def process_item_for_parse(item, api_patterns):
-    """Process a single item to extract repository and file details."""
+def process_item_for_parse(item, api_patterns, matcher=None):
+    """
+    Process a single item to extract repository and file details.
+    matcher: UsageMatcher of the API, files it does not match are dropped
+    """
     repo_name = item["repository"]["full_name"]
     repo_url = item["repository"]["html_url"]
     repo_api_url = item["repository"]["url"]
@@ -211,7 +255,9 @@ def process_item_for_parse(item, api_patterns):
     #     return None
 
     file_url = item["url"]
-    code_content = fetch_file_content(file_url)
+    code_content = fetch_file_content(file_url, item.get("sha"), repo_name, item["path"])
+    if matcher is not None and not matcher.matches(code_content):
+        return None
     
     if code_content:
         return {
@@ -224,35 +270,67 @@ def process_item_for_parse(item, api_patterns):
     return None
 
 
-def parse_results(data, api_patterns,m):
-    """Parse API response and extract code snippets and metadata."""
+def parse_results(data, api_patterns, m, handled=None, on_item=None, matcher=None):
+    """
+    Parse API response and extract code snippets and metadata.
+    handled: urls of items to skip (handled before an interruption)
+    on_item: called with (item, snippet or None) for each item, in order
+    matcher: see process_item_for_parse
+    """
     code_results = []
-    items = data.get("items", [])
+    items = unique_items(data.get("items", []))
+    if handled:
+        items = [item for item in items if item["url"] not in handled]
+    prefetch_repository_details(items)
+    prefetch_clones(items)
 
     with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process_item_for_parse, item, api_patterns) 
+        futures = [executor.submit(process_item_for_parse, item, api_patterns, matcher) 
                   for item in items]
 
-        for future in futures:
+        for item, future in zip(items, futures):
             if len(code_results) >= m:
                 break
 
             result = future.result()
+            if on_item is not None:
+                on_item(item, result)
             if result:
                 code_results.append(result)
 
     return code_results
 
 
-def save_code_snippets(api_name, code_snippets, root, api_tail = None):
-    """Save code snippets to files in the API-specific directory."""
+def snippet_file(api_name, root, api_tail = None):
     if function:
-        file_path = os.path.join(root, f"{api_name.replace('.', '-')}-__init__.jsonl")
-    else:
-        file_path = os.path.join(root, f"{api_name.replace('.', '-')}-{api_tail}.jsonl")
+        return os.path.join(root, f"{api_name.replace('.', '-')}-__init__.jsonl")
+    return os.path.join(root, f"{api_name.replace('.', '-')}-{api_tail}.jsonl")
+
+
+def split_api(api):
+    """(name, tail) a crawled API is saved under: the constructor name and the method name for methods"""
+    if function:
+        return api, ""
+    return tuple(api.rsplit('.', 1))
+
+
+def restore_code_snippets(api_name, code_snippets, root, api_tail = None):
+    """
+    Rewrite the file of an unfinished API with the snippets of the crawl journal,
+    which drops lines written by a run killed before journaling them, and any output of an older crawl.
+    """
+    file_path = snippet_file(api_name, root, api_tail)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    save_code_snippets(api_name, code_snippets, root, api_tail)
+
+
+def save_code_snippets(api_name, code_snippets, root, api_tail = None):
+    """Append code snippets to the file of the API in the API-specific directory."""
+    file_path = snippet_file(api_name, root, api_tail)
     if len(code_snippets) == 0:
         return
-    with open(file_path, "w", encoding="utf-8") as f:
+    with open(file_path, "a", encoding="utf-8") as f:
         for snippet in code_snippets:
             json_line = {
                 "repository": snippet["repo_link"],
@@ -264,20 +342,13 @@ def save_code_snippets(api_name, code_snippets, root, api_tail = None):
             f.write(f"{json.dumps(json_line)}\n")
 
 
-def fetch_code_snippets(api_patterns, page, api_tail = None):
+def build_search_queries(api_patterns, api_tail = None):
     """
-    api_patterns: patterns split from the whole api_path
-    page: which page to crawl from github
-    api_tail: for method api, it means the last segment of the api_path; and None for initial api
+    build GitHub code search queries from the patterns of generate_api_patterns:
+    the direct pattern, then every (import as, usage) and (from import, usage) pair.
+    Returns [(kind, query)], kind is 'direct', 'import_as:{i}' or 'from_import:{i}' with i the number of module
+    segments in the import, the query planner ranks the kinds by their yield
     """
-    global CUR, global_counts
-    """Fetch code snippets using GitHub API for each pattern individually."""
-    base_url = "https://api.github.com/search/code"
-    headers = {
-        "Authorization": f"Bearer {tokens[CUR]}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-    
     # 1. 直接匹配模式
     direct_pattern = api_patterns[0]
     
@@ -299,107 +370,196 @@ def fetch_code_snippets(api_patterns, page, api_tail = None):
     all_queries = []
     # 添加直接匹配的查询
     if function:
-        all_queries.append(f'"{direct_pattern}" language:Python')
+        all_queries.append((DIRECT, f'"{direct_pattern}" language:Python'))
     else:
-        all_queries.append(f'"{direct_pattern}" ".{api_tail}" language:Python')
+        all_queries.append((DIRECT, f'"{direct_pattern}" ".{api_tail}" language:Python'))
     # 添加import as模式的查询
-    for import_pattern, usage_pattern in import_as_pairs:
+    for i, (import_pattern, usage_pattern) in enumerate(import_as_pairs, 1):
         if function:
-            all_queries.append(f'"{import_pattern}" "{usage_pattern}" language:Python')
+            all_queries.append((f'import_as:{i}', f'"{import_pattern}" "{usage_pattern}" language:Python'))
         else:
-            all_queries.append(f'"{import_pattern}" "{usage_pattern}" ".{api_tail}" language:Python')
+            all_queries.append((f'import_as:{i}', f'"{import_pattern}" "{usage_pattern}" ".{api_tail}" language:Python'))
     
     # 添加from import模式的查询
-    for from_pattern, usage_pattern in from_pairs:
+    for i, (from_pattern, usage_pattern) in enumerate(from_pairs, 1):
         if function:
-            all_queries.append(f'"{from_pattern}" "{usage_pattern}" language:Python')
-        else:
-            all_queries.append(f'"{from_pattern}" "{usage_pattern}" ".{api_tail}" language:Python')
-    
-    # 对每个查询模式分别进行搜索
-    all_results = {'total_count': 0, 'items': []}
-    
-    for query in all_queries:
-        params = {
-            "q": query,
-            "per_page": 100,
-            "page": page,
-        }
-        
-        while True:
-            while True:
-                try:
-                    response = requests.get(base_url, headers=headers, params=params)
-                    break
-                except:
-                    continue
-            if response.status_code == 200:
-                break
-            else:
-                CUR += 1
-                CUR %= len(tokens)
-                if CUR == 0:
-                    while True:
-                        if try1(): break
-                        else: 
-                            print("\nwaiting 100s\n")
-                            time.sleep(100)
-                headers['Authorization'] = f"Bearer {tokens[CUR]}"
-        if response.status_code == 200:
-            result = response.json()
-            # 合并结果
-            all_results['total_count'] += result.get('total_count', 0)
-            all_results['items'].extend(result.get('items', []))
-            if all_results['total_count'] > MOUNT:
-                break
+            all_queries.append((f'from_import:{i}', f'"{from_pattern}" "{usage_pattern}" language:Python'))
         else:
-            print(f"Failed to fetch for query {query}: {response.status_code}")
+            all_queries.append((f'from_import:{i}', f'"{from_pattern}" "{usage_pattern}" ".{api_tail}" language:Python'))
+    return all_queries
 
-    global_counts.setdefault(api_patterns[0] + (api_tail or ""), 0)
-    global_counts[api_patterns[0] + (api_tail or "")] += all_results["total_count"]
+
+def fetch_code_snippets(query, page, kind=DIRECT, counter_key=None):
+    """
+    query: one search query of the plan of PLANNER
+    page: which page to crawl from github
+    kind: kind of the query, pages of group queries are kept in memory for the other APIs of the group
+    counter_key: key of global_counts the total count of the query is added to, not for group queries and shards
+    returns None if the search failed, the query is then left unfinished and retried by the next crawl
+    """
+    global global_counts
+    if kind == GROUP:
+        if not PLANNER.group:
+            return {'total_count': 0, 'items': []}
+        result = PLANNER.memo_get((query, page))
+        if result is not None:
+            return result
+
+    base_url = "https://api.github.com/search/code"
+    params = {
+        "q": query,
+        "per_page": PER_PAGE,
+        "page": page,
+    }
+    PLANNER.record_search(kind)
+    response = github_get(base_url, params)
+    if response.status_code != 200:
+        print(f"Failed to fetch for query {query}: {response.status_code}")
+        if kind == GROUP and response.status_code == 422:
+            # OR queries are rejected for good, the group query is skipped as if groups were off
+            PLANNER.disable_groups()
+            return {'total_count': 0, 'items': []}
+        return None
+
+    result = response.json()
+    all_results = {'total_count': result.get('total_count', 0), 'items': result.get('items', [])}
+    if CLONES is not None:
+        CLONES.count(all_results['items'])
+    if kind == GROUP:
+        PLANNER.memo_put((query, page), all_results)
+    elif counter_key is not None and page == 1 and not is_shard(query):
+        global_counts.setdefault(counter_key, 0)
+        global_counts[counter_key] += all_results["total_count"]
     return all_results
 
-def repo_crawler(api_list, root, config, m=5):
-    """Main function to crawl and save API usage examples."""
-    global tokens
+def crawl_targets(api_list, aliases=None):
+    """
+    (canonical API, spellings to search it under) for each distinct API of api_list,
+    signatures are accepted as well, i.e. torch.nn.functional.softmax(input, dim=None)
+    """
+    aliases = aliases or {}
+    spellings = api_spellings(aliases)
+    targets = {}
+    for api in api_list:
+        api = api.split('(', 1)[0]
+        api = aliases.get(api, api)
+        if api not in targets:
+            targets[api] = public_spellings(api, spellings)
+    return list(targets.items())
+
+
+def setup_crawler(config):
+    """set the tokens, caches and query planner of the module from config"""
+    global tokens, SCHEDULER, REPO_CACHE, BLOB_STORE, HTTP_CACHE, CLONES, PLANNER, USAGE_FILTER
     tokens = config.token
-    os.makedirs(root, exist_ok=True)
+    SCHEDULER = create_scheduler(tokens, getattr(config, 'token_state_file', None))
+    REPO_CACHE = create_repo_cache(config)
+    BLOB_STORE = create_blob_store(config)
+    HTTP_CACHE = create_response_cache(config)
+    CLONES = create_repo_clones(config)
+    PLANNER = create_planner(config)
+    USAGE_FILTER = getattr(config, 'usage_filter', True)
+
+
+def crawl_api_steps(api, names, root, m, journal):
+    """
+    Crawl one API into root, query by query along the plan of PLANNER until it has m snippets.
+    A generator that yields every search page once its files are handled and the next step of its query is
+    journaled, one search per step, so that a caller (see crawl_queue) can interleave the APIs of a crawl search by
+    search, and close it at any yield. repo_crawler simply runs it through.
+    """
+    print(f"Processing API: {api}" + (f" (searched as {', '.join(names)})" if names != [api] else ""))
     
-    for api in api_list:
-        print(f"Processing API: {api}")
-        api_tail = ""
-        if not function:# 如果是方法函数，需要提取出构造函数字段
-            api_head, api_tail = api.rsplit('.', 1)
-            api = api_head  # remove the last part
-            # 生成所有可能的匹配模式
-        api_patterns = generate_api_patterns(api)
-        print(f"Generated {len(api_patterns)//2+1} patterns for matching")
+    progress = journal.api_progress(api)
+    total_snippets = progress['snippets']
+    save_name, save_tail = split_api(api)
+    restore_code_snippets(save_name, total_snippets, root, save_tail)
+    seen_urls = set(s['file_url'] for s in total_snippets)
+    # 一个API的所有写法共用一个匹配器
+    matcher = UsageMatcher([split_api(spelling)[0] for spelling in names])
+    for spelling in names:
+        if len(total_snippets) >= m:
+            break
+        if spelling in progress['names']:
+            continue
+        name, api_tail = split_api(spelling)  # 如果是方法函数，需要提取出构造函数字段
+        # 生成所有可能的匹配模式
+        api_patterns = generate_api_patterns(name)
+        plan = PLANNER.plan(spelling, build_search_queries(api_patterns, api_tail))
+        counter_key = api_patterns[0] + api_tail
+        print(f"Planned {len(plan)} queries for matching")
         
-        page = 1
-        total_snippets = []
+        while plan and len(total_snippets) < m:
+            kind, query = plan.pop(0)
+            if (spelling, query) in progress['queries']:
+                continue
+            if (spelling, query) in progress['splits']:
+                plan[:0] = [(kind, shard) for shard in progress['splits'][(spelling, query)]]
+                continue
+            page = progress['pages'].get((spelling, query), 0) + 1
+            while len(total_snippets) < m:
+                data = fetch_code_snippets(query, page, kind, counter_key)
+                if data is None:
+                    # 搜索失败: 查询, 写法和API都不记录完成, 下次从这一页继续
+                    print(f"Stopped API: {api} at a failed search, it is continued by the next crawl")
+                    return
+
+                def on_item(item, snippet):
+                    # 过滤掉None结果, 以及其他写法已经爬到的文件; 如果已经达到目标数量, 不再保存
+                    if snippet is not None and (snippet['file_url'] in seen_urls or len(total_snippets) >= m):
+                        snippet = None
+                    if snippet is not None:
+                        seen_urls.add(snippet['file_url'])
+                        save_code_snippets(save_name, [snippet], root, save_tail)
+                        PLANNER.record_hit(kind)
+                    journal.finish_item(api, spelling, query, page, item['url'], snippet)
+
+                parse_results(data, api_patterns, min(m - len(total_snippets), len(data['items'])),
+                              progress['items'], on_item, matcher if USAGE_FILTER or kind == GROUP else None)
+                journal.finish_page(api, spelling, query, page)
+                step = next_step(data, page, query)
+                if step == SPLIT:
+                    # 超过1000条结果的查询按文件大小拆分, 直到每个分片都能完整翻页
+                    shards = split_query(query)
+                    journal.split_query(api, spelling, query, shards)
+                    plan[:0] = [(kind, shard) for shard in shards]
+                elif step == DONE:
+                    journal.finish_query(api, spelling, query)
+                yield data
+                if step != NEXT_PAGE:
+                    break
+                page += 1
+        journal.finish_name(api, spelling)
         
-        while len(total_snippets) < m:
-            data = fetch_code_snippets(api_patterns, page, api_tail)
-            if not data or len(data['items']) == 0:
-                break
-                
-            snippets = parse_results(data, api_patterns,
-                                   min(m - len(total_snippets), len(data['items'])))
-            
-            # 过滤掉None结果
-            snippets = [s for s in snippets if s is not None]
-            total_snippets.extend(snippets)
-            
-            # 如果已经达到目标数量，就退出
-            if len(total_snippets) >= m:
-                break
-                
-            page += 1
-            
-        # 如果收集到的snippets超过了需要的数量，只保留前m个
-        total_snippets = total_snippets[:min(m, len(total_snippets))]
-        save_code_snippets(api, total_snippets, root, api_tail)
-        print(f"Saved {len(total_snippets)} snippets for API: {api}")
+    count = len(total_snippets)
+    journal.finish_api(api, count)
+    PLANNER.save()
+    print(f"Saved {count} snippets for API: {api}")
+
+
+def repo_crawler(api_list, root, config, m=5, aliases=None):
+    """
+    Main function to crawl and save API usage examples.
+    aliases: {spelling: canonical API} index of the inspector, each API is crawled once under its public
+             spellings and saved under its canonical name
+    Progress is recorded in the crawl journal of root (see crawl_journal.CrawlJournal), a restarted crawl skips
+    finished APIs and continues the unfinished one from its next item.
+    Searches follow the plan of query_planner.QueryPlanner, query by query until the API has m snippets.
+    """
+    setup_crawler(config)
+    os.makedirs(root, exist_ok=True)
+    journal = open_journal(root, config)
+    
+    targets = crawl_targets(api_list, aliases)
+    if function:
+        targets = PLANNER.plan_targets(targets)
+    for api, names in targets:
+        if journal.is_done(api):
+            print(f"Skip API: {api}, finished by a previous crawl")
+            continue
+        for _ in crawl_api_steps(api, names, root, m, journal):
+            pass
+    journal.close()
         
 
         
@@ -1,6 +1,7 @@
 import ast
 import re
-from typing import List, Optional
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional
 from dataclasses import dataclass
 from enum import Enum, auto
 
@@ -8,6 +9,7 @@ from enum import Enum, auto
 
 
 parse_error = 0
+NESTED_REPR_PATTERN = re.compile(r"<[^<>]*>")
 
 class ParameterKind(Enum):
     POSITIONAL_ONLY = auto()
@@ -25,14 +27,64 @@ class Parameter:
     default: Optional[ast.AST]
 
 
+@dataclass
+class CompiledSignature:
+    """
+    A signature parsed once, with everything compare_signature needs precomputed.
+    """
+    parameters: List[Parameter]
+    by_name: Dict[str, Parameter]       # positional-only, positional-or-keyword and keyword-only parameters
+    positional: List[Parameter]         # positional-only + positional-or-keyword parameters, in order
+    kw_only_names: FrozenSet[str]
+    n_pos_only: int
+    n_pos_or_kw: int
+    n_var_pos: int
+    n_var_kw: int
+
+    @classmethod
+    def from_parameters(cls, parameters: List[Parameter]):
+        named_kinds = (ParameterKind.POSITIONAL_ONLY, ParameterKind.POSITIONAL_OR_KEYWORD, ParameterKind.KEYWORD_ONLY)
+        positional = [p for p in parameters if p.kind in named_kinds[:2]]
+        return cls(
+            parameters=parameters,
+            by_name={p.name: p for p in parameters if p.kind in named_kinds},
+            positional=positional,
+            kw_only_names=frozenset(p.name for p in parameters if p.kind == ParameterKind.KEYWORD_ONLY),
+            n_pos_only=sum(p.kind == ParameterKind.POSITIONAL_ONLY for p in positional),
+            n_pos_or_kw=sum(p.kind == ParameterKind.POSITIONAL_OR_KEYWORD for p in positional),
+            n_var_pos=sum(p.kind == ParameterKind.VAR_POSITIONAL for p in parameters),
+            n_var_kw=sum(p.kind == ParameterKind.VAR_KEYWORD for p in parameters),
+        )
+
+
+@lru_cache(maxsize=1 << 17)
+def compile_signature(signature_str: str) -> Optional[CompiledSignature]:
+    """
+    parse signature once, repeated calls with the same string are served from the cache
+    """
+    parameters = _parse_signature(signature_str)
+    if parameters is None:
+        return None
+    return CompiledSignature.from_parameters(parameters)
+
+
 def parse_signature(signature_str: str) -> List[Parameter]:
     """
     parse signature and return parameters list
     """
+    compiled = compile_signature(signature_str)
+    if compiled is None:
+        return None
+    return list(compiled.parameters)
+
+
+def _parse_signature(signature_str: str) -> List[Parameter]:
     def replace_func(code):
-        while re.search(r"<[^<>]*>", code):
-            code = re.sub(r"<[^<>]*>", "None", code)
-        return code
+        # i.e. <function <lambda> at 0x...> -> None, innermost first
+        while True:
+            code, n = NESTED_REPR_PATTERN.subn("None", code)
+            if n == 0:
+                return code
     
     global parse_error
     signature = signature_str.rsplit('->', 1)[0].strip()
@@ -107,79 +159,58 @@ def parse_signature(signature_str: str) -> List[Parameter]:
     
     return parameters
 
-def compare_signature(sig1: str, sig2: str) -> bool:
-    try:
-        params1 = parse_signature(sig1)
-        params2 = parse_signature(sig2)
-        if params1 is None or params2 is None:
-            return 0
-    except ValueError as e:
-        print(e)
-        return 0
-    
-    def categorize(params: List[Parameter]):
-        pos_only = [p for p in params if p.kind == ParameterKind.POSITIONAL_ONLY]
-        pos_or_kw = [p for p in params if p.kind == ParameterKind.POSITIONAL_OR_KEYWORD]
-        var_pos = [p for p in params if p.kind == ParameterKind.VAR_POSITIONAL]
-        kw_only = [p for p in params if p.kind == ParameterKind.KEYWORD_ONLY]
-        var_kw = [p for p in params if p.kind == ParameterKind.VAR_KEYWORD]
-        def get_name_set(l):
-            name_set = set()
-            for p in l:
-                name_set.add(p.name)
-            return name_set
-        
-        return {
-            "pos_only": pos_only,
-            "pos_or_kw": pos_or_kw,
-            "var_pos": var_pos,
-            "kw_only": kw_only,
-            "var_kw": var_kw,
-            "pos_only_name": get_name_set(pos_only),
-            "pos_or_kw_name": get_name_set(pos_or_kw),
-            "kw_only_name": get_name_set(kw_only),
-        }
-    
-    cat1 = categorize(params1)
-    cat2 = categorize(params2)
-    
+def compare_compiled_signature(sig1: CompiledSignature, sig2: CompiledSignature) -> int:
+    """
+    2: a parameter became required / was removed without default / lost its default, i.e. old calls may break
+    1: other changes of parameter numbers, order, names or kinds
+    0: no change
+    """
     # default value judgement
-    sig1_param_name = cat1["pos_only_name"] | cat1["pos_or_kw_name"] | cat1["kw_only_name"]
-    sig2_param_name = cat2["pos_only_name"] | cat2["pos_or_kw_name"] | cat2["kw_only_name"]
-    def get_default(p, name):
-        for p_ in p:
-            if p_.name == name:
-                return p_.has_default
-    for name in sig1_param_name & sig2_param_name:
-        if get_default(params1, name) != get_default(params2, name):
+    by_name1 = sig1.by_name
+    by_name2 = sig2.by_name
+    for name, p1 in by_name1.items():
+        p2 = by_name2.get(name)
+        if p2 is None:
+            if not p1.has_default:
+                return 2
+        elif p1.has_default != p2.has_default:
             return 2
-    for name in sig1_param_name - sig2_param_name:
-        if not get_default(params1, name):
-            return 2
-    for name in sig2_param_name - sig1_param_name:
-        if not get_default(params2, name):
+    for name, p2 in by_name2.items():
+        if name not in by_name1 and not p2.has_default:
             return 2
     
     # compare numbers of parameters
-    if len(cat1["pos_only"]) != len(cat2["pos_only"]) or len(cat1["pos_or_kw"]) != len(cat2["pos_or_kw"]):
+    if sig1.n_pos_only != sig2.n_pos_only or sig1.n_pos_or_kw != sig2.n_pos_or_kw:
         return 1
     
     # compare position-only parameters, and must keep no change of position
-    for p1, p2 in zip(cat1["pos_only"] + cat1["pos_or_kw"], cat2["pos_only"] + cat2["pos_or_kw"]):
+    for p1, p2 in zip(sig1.positional, sig2.positional):
         if p1.name != p2.name or p1.kind != p2.kind:
             return 1
     
     # compare keyword-only parameters
     # get all keywords of parameters, and must keep no change of names
-    if cat1["kw_only_name"] != cat2["kw_only_name"]:
+    if sig1.kw_only_names != sig2.kw_only_names:
         return 1
     
     # compare *args & **kwargs
-    if len(cat1["var_pos"]) != len(cat2["var_pos"]) or len(cat1["var_kw"]) != len(cat2["var_kw"]):
+    if sig1.n_var_pos != sig2.n_var_pos or sig1.n_var_kw != sig2.n_var_kw:
         return 1
     
     return 0
 
+
+def compare_signature(sig1: str, sig2: str) -> int:
+    try:
+        compiled1 = compile_signature(sig1)
+        compiled2 = compile_signature(sig2)
+        if compiled1 is None or compiled2 is None:
+            return 0
+    except ValueError as e:
+        print(e)
+        return 0
+    return compare_compiled_signature(compiled1, compiled2)
+
 import json
 def read_json(path):
     with open(path, 'r') as f:
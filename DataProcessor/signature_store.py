@@ -0,0 +1,184 @@
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+from typing import Dict, Iterator, List, Optional
+
+from DataProcessor.signature_mapping import compare_signature
+from DataProcessor.api_alias import match_renamed_apis
+
+
+
+KINDS = ['function', 'method', 'function_ref', 'method_ref']
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs (
+    hash TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS signatures (
+    lib TEXT NOT NULL,
+    version TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    doc_hash TEXT,
+    PRIMARY KEY (lib, version, kind, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS signatures_name ON signatures (lib, kind, name);
+'''
+
+
+def doc_hash(doc) -> Optional[str]:
+    if doc is None:
+        return None
+    return hashlib.sha256(doc.encode('utf-8')).hexdigest()
+
+
+class SignatureStore:
+    """
+    Single-file SQLite store of API signature snapshots.
+
+    Signatures are indexed by (lib, version, kind, name), and docstrings are kept once in a table keyed by their sha256,
+    so a docstring unchanged over many releases is stored once. For 'function_ref' / 'method_ref' rows the signature
+    column holds the referenced key of 'function' / 'method'.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def has_snapshot(self, lib, version) -> bool:
+        row = self.conn.execute('SELECT 1 FROM signatures WHERE lib = ? AND version = ? LIMIT 1', (lib, version)).fetchone()
+        return row is not None
+
+    def add_signatures(self, lib, version, kind, signatures: Dict):
+        '''replace the signatures of (lib, version, kind) by a {name: {'signature', 'doc'}} dict'''
+        docs = []
+        rows = []
+        for name, value in signatures.items():
+            if kind.endswith('_ref'):
+                rows.append((lib, version, kind, name, value, None))
+                continue
+            hash_ = doc_hash(value.get('doc'))
+            if hash_ is not None:
+                docs.append((hash_, value['doc']))
+            rows.append((lib, version, kind, name, value['signature'], hash_))
+        with self.conn:
+            self.conn.execute('DELETE FROM signatures WHERE lib = ? AND version = ? AND kind = ?', (lib, version, kind))
+            self.conn.executemany('INSERT OR IGNORE INTO docs (hash, doc) VALUES (?, ?)', docs)
+            self.conn.executemany('INSERT INTO signatures VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def add_snapshot(self, lib, version, snapshot_dir):
+        '''load function.json / method.json and the *_ref.json alias files saved by the inspector'''
+        for kind in KINDS:
+            path = os.path.join(snapshot_dir, f'{kind}.json')
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                self.add_signatures(lib, version, kind, json.load(f))
+
+    def get(self, lib, version, kind, name) -> Optional[Dict]:
+        '''point lookup of one API, aliases are followed'''
+        if kind in ['function', 'method']:
+            row = self.conn.execute('SELECT signature FROM signatures WHERE lib = ? AND version = ? AND kind = ? AND name = ?',
+                                    (lib, version, f'{kind}_ref', name)).fetchone()
+            if row is not None:
+                name = row[0]
+        row = self.conn.execute('''
+            SELECT s.signature, d.doc FROM signatures s LEFT JOIN docs d ON d.hash = s.doc_hash
+            WHERE s.lib = ? AND s.version = ? AND s.kind = ? AND s.name = ?''', (lib, version, kind, name)).fetchone()
+        if row is None:
+            return None
+        return {'signature': row[0], 'doc': row[1]}
+
+    def iter_apis(self, lib, version, kind) -> Iterator[Dict]:
+        cursor = self.conn.execute('''
+            SELECT s.signature, d.doc FROM signatures s LEFT JOIN docs d ON d.hash = s.doc_hash
+            WHERE s.lib = ? AND s.version = ? AND s.kind = ? ORDER BY s.name''', (lib, version, kind))
+        for signature, doc in cursor:
+            yield {'signature': signature, 'doc': doc}
+
+    def load(self, lib, version, kind) -> Dict:
+        '''the same dict as the json file of the snapshot'''
+        return {api['signature'].split('(', 1)[0]: api for api in self.iter_apis(lib, version, kind)}
+
+    def load_refs(self, lib, version, kind) -> Dict[str, str]:
+        '''{spelling: key} of the {kind}_ref rows, the same dict as the *_ref.json of the snapshot'''
+        cursor = self.conn.execute('SELECT name, signature FROM signatures WHERE lib = ? AND version = ? AND kind = ?',
+                                   (lib, version, f'{kind}_ref'))
+        return dict(cursor.fetchall())
+
+    def _one_sided(self, lib, version, other_version, kind) -> List[Dict]:
+        '''APIs of version whose name does not exist in other_version'''
+        cursor = self.conn.execute('''
+            SELECT s.signature, d.doc FROM signatures s LEFT JOIN docs d ON d.hash = s.doc_hash
+            WHERE s.lib = ? AND s.version = ? AND s.kind = ? AND NOT EXISTS (
+                SELECT 1 FROM signatures o WHERE o.lib = s.lib AND o.version = ? AND o.kind = s.kind AND o.name = s.name)
+            ORDER BY s.name''', (lib, version, kind, other_version))
+        return [{'signature': signature, 'doc': doc} for signature, doc in cursor]
+
+    def api_updating(self, lib, old_version, new_version, kind):
+        '''
+        The same output as api_update.api_updating, computed with set queries over the index:
+        only APIs whose signature text differs are loaded and passed to compare_signature.
+        '''
+        deleted = {api['signature'].split('(', 1)[0]: api for api in self._one_sided(lib, old_version, new_version, kind)}
+        added = {api['signature'].split('(', 1)[0]: api for api in self._one_sided(lib, new_version, old_version, kind)}
+        renamed = match_renamed_apis(deleted, self.load_refs(lib, old_version, kind),
+                                     added, self.load_refs(lib, new_version, kind))
+        deleted_apis = [api for name, api in deleted.items() if name not in renamed]
+        added_apis = [api for name, api in added.items() if name not in renamed.values()]
+        modified_apis = {'required_args': [], 'optional_args': []}
+        outdated_apis = {'required_args': [], 'optional_args': []}
+
+        def compare(old_api, new_api):
+            res = compare_signature(old_api['signature'], new_api['signature'])
+            type_ = {2: 'required_args', 1: 'optional_args'}.get(res)
+            if type_ is not None:
+                modified_apis[type_].append(new_api)
+                outdated_apis[type_].append(old_api)
+
+        cursor = self.conn.execute('''
+            SELECT o.signature, od.doc, n.signature, nd.doc
+            FROM signatures o JOIN signatures n ON n.lib = o.lib AND n.version = ? AND n.kind = o.kind AND n.name = o.name
+            LEFT JOIN docs od ON od.hash = o.doc_hash
+            LEFT JOIN docs nd ON nd.hash = n.doc_hash
+            WHERE o.lib = ? AND o.version = ? AND o.kind = ? AND o.signature != n.signature
+            ORDER BY o.name''', (new_version, lib, old_version, kind))
+        for old_signature, old_doc, new_signature, new_doc in cursor:
+            compare({'signature': old_signature, 'doc': old_doc}, {'signature': new_signature, 'doc': new_doc})
+        # APIs stored under another key in the new version, found through the *_ref rows
+        for old_name, new_name in sorted(renamed.items()):
+            compare(deleted[old_name], added[new_name])
+
+        return deleted_apis, added_apis, modified_apis, outdated_apis
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', type=str, required=True)
+    parser.add_argument('--lib', type=str, required=True)
+    parser.add_argument('--version', type=str, required=True)
+    parser.add_argument('--snapshot_dir', type=str, default=None, help='Import a saved snapshot into the store.')
+    parser.add_argument('--kind', type=str, default='function', choices=KINDS)
+    parser.add_argument('--query', type=str, nargs='*', default=[], help='APIs to look up.')
+    args = parser.parse_args()
+
+    with SignatureStore(args.db) as store:
+        if args.snapshot_dir:
+            store.add_snapshot(args.lib, args.version, args.snapshot_dir)
+        for name in args.query:
+            print(f'{name}: {store.get(args.lib, args.version, args.kind, name)}')
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from typing import Dict, List, Optional
+
+from DataProcessor.inspect_signature import INSPECTOR_VERSION
+from DataProcessor.static_signature import STATIC_INSPECTOR_VERSION
+
+
+
+RUNTIME_INSPECTOR = f'runtime-{INSPECTOR_VERSION}'
+STATIC_INSPECTOR = f'static-{STATIC_INSPECTOR_VERSION}'
+CURRENT_INSPECTORS = {RUNTIME_INSPECTOR, STATIC_INSPECTOR}
+
+
+def runtime_inspector(inspector_args=None):
+    '''options of inspect_signature.py change its output, so they are part of the cache key'''
+    return ' '.join([RUNTIME_INSPECTOR] + list(inspector_args or []))
+
+
+class SnapshotCache:
+    """
+    Persistent cache of signature snapshots (function.json, method.json, ...).
+    Each entry is stored under the sha256 of (lib, version, inspector version),
+    so the same release is never inspected twice, no matter which result_{n} directory a run writes into.
+    The python version of the venv that ran the inspector is only recorded in meta.json: it is not known
+    before the venv exists, and a cache hit is meant to skip creating it.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(lib, version, inspector=RUNTIME_INSPECTOR) -> str:
+        raw = json.dumps([lib, version, inspector])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, lib, version, inspector=RUNTIME_INSPECTOR) -> Optional[str]:
+        '''return the directory of a complete snapshot, or None'''
+        entry_dir = self.entry_dir(self.key(lib, version, inspector))
+        if os.path.exists(os.path.join(entry_dir, 'meta.json')):
+            return entry_dir
+        return None
+
+    def restore(self, lib, version, save_dir, inspector=RUNTIME_INSPECTOR) -> bool:
+        '''copy a cached snapshot into save_dir, return False on cache miss'''
+        entry_dir = self.lookup(lib, version, inspector)
+        if entry_dir is None:
+            return False
+        os.makedirs(save_dir, exist_ok=True)
+        for fname in os.listdir(entry_dir):
+            if fname != 'meta.json':
+                shutil.copy(os.path.join(entry_dir, fname), os.path.join(save_dir, fname))
+        return True
+
+    def store(self, lib, version, snapshot_dir, inspector=RUNTIME_INSPECTOR, python_version=None) -> str:
+        '''copy the json files of snapshot_dir into the cache, python_version: of the venv, None without one'''
+        key = self.key(lib, version, inspector)
+        entry_dir = self.entry_dir(key)
+        tmp_dir = f'{entry_dir}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for fname in os.listdir(snapshot_dir):
+            if fname.endswith('.json'):
+                shutil.copy(os.path.join(snapshot_dir, fname), os.path.join(tmp_dir, fname))
+        # meta.json is written last, an entry without it is never served
+        meta = {
+            'lib': lib,
+            'version': version,
+            'python_version': python_version,
+            'inspector': inspector,
+            'created': time.time(),
+        }
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=4)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        return entry_dir
+
+    def entries(self) -> List[Dict]:
+        entries = []
+        for key in sorted(os.listdir(self.cache_dir)):
+            meta_path = os.path.join(self.cache_dir, key, 'meta.json')
+            if not os.path.exists(meta_path):
+                continue
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['key'] = key
+            entries.append(meta)
+        return entries
+
+    def evict(self, lib=None, version=None, max_age_days=None, stale_only=False) -> int:
+        '''
+        Remove cache entries and return the number of removed entries.
+
+        Args:
+            lib / version: only consider entries of this library / version.
+            max_age_days: remove entries older than this.
+            stale_only: only remove entries written by an outdated inspector.
+        If neither max_age_days nor stale_only is given, every matched entry is removed.
+        '''
+        now = time.time()
+        removed = 0
+        for meta in self.entries():
+            if lib is not None and meta['lib'] != lib:
+                continue
+            if version is not None and meta['version'] != version:
+                continue
+            stale = meta['inspector'].split(' ')[0] not in CURRENT_INSPECTORS
+            expired = max_age_days is not None and now - meta['created'] > max_age_days * 86400
+            if (stale_only or max_age_days is not None) and not ((stale_only and stale) or expired):
+                continue
+            shutil.rmtree(self.entry_dir(meta['key']), ignore_errors=True)
+            removed += 1
+        return removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache_dir', type=str, required=True)
+    parser.add_argument('--lib', type=str, default=None)
+    parser.add_argument('--version', type=str, default=None)
+    parser.add_argument('--evict', action='store_true', help='Remove matched entries.')
+    parser.add_argument('--max_age_days', type=float, default=None)
+    parser.add_argument('--stale_only', action='store_true', help='Only remove entries of outdated inspectors.')
+    args = parser.parse_args()
+
+    cache = SnapshotCache(args.cache_dir)
+    if args.evict:
+        removed = cache.evict(args.lib, args.version, args.max_age_days, args.stale_only)
+        print(f'Evicted {removed} snapshots from {args.cache_dir}')
+    else:
+        for meta in cache.entries():
+            print(f"{meta['key'][:12]}  {meta['lib']}=={meta['version']}  python {meta['python_version']}  {meta['inspector']}")
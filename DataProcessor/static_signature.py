@@ -0,0 +1,420 @@
+import ast
+import os
+import re
+import json
+import tarfile
+import zipfile
+import fnmatch
+import argparse
+from typing import Dict, List, Optional
+
+from DataProcessor.inspect_signature import APIInspector, DEFAULT_EXCLUDE, format_arguments
+
+
+
+ARCHIVE_SUFFIXES = ('.whl', '.tar.gz', '.tgz', '.tar.bz2', '.zip')
+COMPILED_SUFFIXES = ('.so', '.pyd')
+# bump when the extracted output changes, cached snapshots of older versions become stale
+STATIC_INSPECTOR_VERSION = '2'
+
+
+def normalize_dist_name(name):
+    '''scikit-learn / scikit_learn / Scikit.Learn -> scikit_learn'''
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+
+def find_archive(archive_dir, lib, version) -> Optional[str]:
+    '''find a local wheel or sdist of lib==version in archive_dir, wheels are preferred'''
+    if archive_dir is None or not os.path.isdir(archive_dir):
+        return None
+    candidates = []
+    for fname in os.listdir(archive_dir):
+        suffix = next((suffix for suffix in ARCHIVE_SUFFIXES if fname.endswith(suffix)), None)
+        if suffix is None:
+            continue
+        stem = fname[:-len(suffix)]
+        if suffix == '.whl':
+            # name-version-pytag-abitag-platform.whl
+            dist_name, dist_version = stem.split('-')[:2]
+        else:
+            # name-version.tar.gz
+            dist_name, _, dist_version = stem.rpartition('-')
+        if normalize_dist_name(dist_name) == normalize_dist_name(lib) and dist_version == version:
+            candidates.append(fname)
+    if not candidates:
+        return None
+    candidates.sort(key=lambda fname: (not fname.endswith('.whl'), fname))
+    return os.path.join(archive_dir, candidates[0])
+
+
+def iter_archive_members(archive_path):
+    '''yield (member_path, content) for every .py/.pyi file and (member_path, None) for compiled modules'''
+    def wanted(name):
+        return name.endswith(('.py', '.pyi')) or name.endswith(COMPILED_SUFFIXES)
+
+    if archive_path.endswith(('.whl', '.zip')):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not wanted(info.filename):
+                    continue
+                if info.filename.endswith(COMPILED_SUFFIXES):
+                    yield info.filename, None
+                else:
+                    yield info.filename, zf.read(info)
+    else:
+        with tarfile.open(archive_path) as tf:
+            for member in tf:
+                if not member.isfile() or not wanted(member.name):
+                    continue
+                if member.name.endswith(COMPILED_SUFFIXES):
+                    yield member.name, None
+                else:
+                    yield member.name, tf.extractfile(member).read()
+
+
+def module_name_from_path(member_path, library_name) -> Optional[str]:
+    '''torch-2.0.0/torch/nn/functional.py -> torch.nn.functional, None if outside the library package'''
+    parts = member_path.replace('\\', '/').split('/')
+    root = library_name.split('.')[0]
+    if root not in parts[:-1] and parts[-1].split('.')[0] != root:
+        return None
+    start = parts.index(root) if root in parts[:-1] else len(parts) - 1
+    parts = parts[start:]
+    # foo.cpython-311-x86_64-linux-gnu.so / foo.pyi / foo.py -> foo
+    parts[-1] = parts[-1].split('.')[0]
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    if any(not part.isidentifier() for part in parts):
+        return None
+    return '.'.join(parts)
+
+
+class StaticAPIInspector(APIInspector):
+    """
+    Collect signatures from the source files of a wheel / sdist with `ast`, without installing or importing the library.
+    The layout follows the parallel APIInspector walk: every module that is not excluded is walked under its own
+    name, functions are keyed by their defining module and re-exports go into function_ref.json, methods are stored
+    once under the best public path of their defining class and the other spellings go into method_ref.json.
+    Only names bound visibly in the source are followed, exports built at import time are missed.
+    """
+    def __init__(self, library_name):
+        super().__init__(library_name, None)
+        self.respect_all = True
+        self.compiled_modules = set()
+        self.stub_keys = set()
+        # module -> {'names': {name: (kind, target)}, 'stars': [modules], 'all': names of __all__ or None}
+        self.namespaces = {}
+        # key -> record of every top-level function, private ones are only saved when re-exported publicly
+        self.module_functions = {}
+        # class key -> (defining module, dotted base names)
+        self.class_bases = {}
+        self.exports = {}
+
+    @staticmethod
+    def is_public(name):
+        return not name.startswith('_')
+
+    @staticmethod
+    def decorator_names(node):
+        names = set()
+        for decorator in node.decorator_list:
+            if isinstance(decorator, ast.Call):
+                decorator = decorator.func
+            if isinstance(decorator, ast.Attribute):
+                names.add(decorator.attr)
+            elif isinstance(decorator, ast.Name):
+                names.add(decorator.id)
+        return names
+
+    @staticmethod
+    def dotted_name(node) -> Optional[str]:
+        '''torch.nn.Module for the Attribute chain of a base class, None for anything else'''
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+        return '.'.join([node.id] + parts[::-1])
+
+    def iter_definitions(self, body, types=(ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        """
+        yield top-level statements of the given types, including those guarded by `if` / `try` blocks
+        """
+        for node in body:
+            if isinstance(node, types):
+                yield node
+            elif isinstance(node, ast.If):
+                yield from self.iter_definitions(node.body, types)
+                yield from self.iter_definitions(node.orelse, types)
+            elif isinstance(node, ast.Try):
+                for block in [node.body, node.orelse, node.finalbody] + [h.body for h in node.handlers]:
+                    yield from self.iter_definitions(block, types)
+
+    def get_method_signature(self, node) -> Optional[str]:
+        decorators = self.decorator_names(node)
+        if decorators & {'property', 'cached_property', 'setter', 'getter', 'deleter'}:
+            return None
+        args = node.args
+        if 'classmethod' in decorators:
+            # bound classmethods hide `cls`, the same as inspect.signature does
+            args = ast.arguments(**{field: getattr(args, field) for field in args._fields})
+            if args.posonlyargs:
+                args.posonlyargs = args.posonlyargs[1:]
+            elif args.args:
+                args.args = args.args[1:]
+        return format_arguments(args, node.returns)
+
+    def read_namespace(self, module_name, tree, is_package):
+        '''the names a module binds by definitions and imports of the library, and its literal __all__'''
+        namespace = self.namespaces.setdefault(module_name, {'names': {}, 'stars': [], 'all': None})
+        package = module_name if is_package else module_name.rpartition('.')[0]
+        statements = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Import, ast.ImportFrom,
+                      ast.Assign, ast.AugAssign)
+        for node in self.iter_definitions(tree.body, statements):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                namespace['names'][node.name] = ('function', f'{module_name}.{node.name}')
+            elif isinstance(node, ast.ClassDef):
+                namespace['names'][node.name] = ('class', f'{module_name}.{node.name}')
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        namespace['names'][alias.asname] = ('import', alias.name)
+                    else:
+                        # import torch.nn binds torch only
+                        namespace['names'][alias.name.split('.')[0]] = ('import', alias.name.split('.')[0])
+            elif isinstance(node, ast.ImportFrom):
+                if node.level:
+                    base = package.split('.')
+                    base = base[:len(base) - node.level + 1]
+                    source = '.'.join(base + ([node.module] if node.module else []))
+                else:
+                    source = node.module
+                for alias in node.names:
+                    if alias.name == '*':
+                        namespace['stars'].append(source)
+                    else:
+                        namespace['names'][alias.asname or alias.name] = ('import', f'{source}.{alias.name}')
+            else:
+                target = node.targets[0] if isinstance(node, ast.Assign) else node.target
+                if not (isinstance(target, ast.Name) and target.id == '__all__'):
+                    continue
+                try:
+                    names = list(ast.literal_eval(node.value))
+                except ValueError:
+                    # a computed __all__ is not followed
+                    continue
+                if isinstance(node, ast.AugAssign) and namespace['all'] is not None:
+                    names = namespace['all'] + names
+                namespace['all'] = [name for name in names if isinstance(name, str)]
+
+    def exported_names(self, module_name, seen=None) -> Dict[str, None]:
+        '''
+        the public names of a module in order, star imports included, limited to __all__ if it has a literal one.
+        Only called once every source is read, the result is kept.
+        '''
+        if module_name in self.exports:
+            return self.exports[module_name]
+        seen = seen if seen is not None else set()
+        namespace = self.namespaces.get(module_name)
+        if namespace is None or module_name in seen:
+            return {}
+        seen.add(module_name)
+        if namespace['all'] is not None and self.respect_all:
+            names = [name for name in namespace['all'] if self.is_public(name)]
+        else:
+            names = [name for name in namespace['names'] if self.is_public(name)]
+            for star in namespace['stars']:
+                names += list(self.exported_names(star, seen))
+        self.exports[module_name] = dict.fromkeys(names)
+        return self.exports[module_name]
+
+    def resolve(self, module_name, name, seen=None) -> Optional[tuple]:
+        '''(kind, key) a name of a module stands for, kind is function / class / module, following its imports'''
+        seen = seen if seen is not None else set()
+        if (module_name, name) in seen:
+            return None
+        seen.add((module_name, name))
+        namespace = self.namespaces.get(module_name, {'names': {}, 'stars': []})
+        entry = namespace['names'].get(name)
+        if entry is None:
+            for star in namespace['stars']:
+                if name in self.exported_names(star):
+                    return self.resolve(star, name, seen)
+            submodule = f'{module_name}.{name}'
+            return ('module', submodule) if submodule in self.namespaces else None
+        kind, target = entry
+        if kind != 'import':
+            return entry
+        return self.resolve_dotted(target, seen)
+
+    def resolve_dotted(self, target, seen=None) -> Optional[tuple]:
+        if target in self.namespaces:
+            return ('module', target)
+        module_name, _, name = target.rpartition('.')
+        if not module_name:
+            return None
+        return self.resolve(module_name, name, seen)
+
+    def resolve_base(self, module_name, dotted) -> Optional[str]:
+        '''the class key of a base class expression of a class body in module_name'''
+        parts = dotted.split('.')
+        resolved = self.resolve(module_name, parts[0])
+        for part in parts[1:]:
+            if resolved is None or resolved[0] != 'module':
+                return None
+            resolved = self.resolve(resolved[1], part)
+        if resolved is None or resolved[0] != 'class' or resolved[1] not in self.classes:
+            return None
+        return resolved[1]
+
+    def class_mro(self, key, visiting=None) -> List[str]:
+        '''library classes along the bases of a class, depth first, the class itself first'''
+        if self.classes[key]['mro'] is not None:
+            return self.classes[key]['mro']
+        visiting = visiting if visiting is not None else set()
+        visiting.add(key)
+        mro = [key]
+        module_name, bases = self.class_bases[key]
+        for dotted in bases:
+            base = self.resolve_base(module_name, dotted)
+            if base is None or base in visiting:
+                continue
+            mro += [klass for klass in self.class_mro(base, visiting) if klass not in mro]
+        self.classes[key]['mro'] = mro
+        return mro
+
+    def inspect_source(self, module_name, source, is_stub=False, is_package=False):
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError) as e:
+            print(f"Error while parsing {module_name}: {str(e)}")
+            return
+
+        def record(records, key, name, signature, doc):
+            old = records.get(name)
+            if is_stub:
+                # the first stub definition (i.e. the first @overload) wins, docstrings usually stay in the .py file
+                if key in self.stub_keys:
+                    return
+                self.stub_keys.add(key)
+                doc = doc or (old['doc'] if old else None)
+            records[name] = {'signature': signature, 'doc': doc}
+
+        self.read_namespace(module_name, tree, is_package)
+        for node in self.iter_definitions(tree.body):
+            if isinstance(node, ast.ClassDef):
+                class_key = f'{module_name}.{node.name}'
+                entry = self.classes.setdefault(class_key, {'paths': [], 'methods': {}, 'mro': None})
+                self.class_bases.setdefault(class_key, (module_name, [name for name in map(self.dotted_name, node.bases)
+                                                                        if name is not None]))
+                for method in self.iter_definitions(node.body):
+                    if isinstance(method, ast.ClassDef):
+                        continue
+                    if not self.is_public_method(method.name):
+                        continue
+                    if not is_stub and 'overload' in self.decorator_names(method):
+                        continue
+                    sig = self.get_method_signature(method)
+                    if sig:
+                        record(entry['methods'], f'{class_key}.{method.name}', method.name, sig,
+                               ast.get_docstring(method))
+            else:
+                if not is_stub and 'overload' in self.decorator_names(node):
+                    continue
+                key = f'{module_name}.{node.name}'
+                record(self.module_functions, key, key, key + format_arguments(node.args, node.returns),
+                       ast.get_docstring(node))
+
+    def walk_modules(self):
+        """
+        the public names of every module that is not excluded, with the filter of the parallel runtime walk:
+        the functions reached are saved, re-exports recorded in function_ref and the public paths of classes collected
+        """
+        for module_name in sorted(self.namespaces):
+            if module_name != self.library_name and any(fnmatch.fnmatchcase(module_name, pattern)
+                                                        for pattern in DEFAULT_EXCLUDE):
+                continue
+            for name in self.exported_names(module_name):
+                resolved = self.resolve(module_name, name)
+                if resolved is None:
+                    continue
+                kind, key = resolved
+                path = f'{module_name}.{name}'
+                if kind == 'function' and key in self.module_functions:
+                    self.signatures['function'].setdefault(key, self.module_functions[key])
+                    if path != key:
+                        self.signatures['function_ref'][path] = key
+                elif kind == 'class' and path not in self.classes[key]['paths']:
+                    self.classes[key]['paths'].append(path)
+        for key in self.classes:
+            self.class_mro(key)
+
+    def inspect_archive(self, archive_path):
+        sources = []
+        compiled = set()
+        stubs = set()
+        for member_path, content in iter_archive_members(archive_path):
+            module_name = module_name_from_path(member_path, self.library_name)
+            if module_name is None:
+                continue
+            if content is None:
+                compiled.add(module_name)
+                continue
+            is_stub = member_path.endswith('.pyi')
+            if is_stub:
+                stubs.add(module_name)
+            is_package = os.path.basename(member_path).split('.')[0] == '__init__'
+            sources.append((module_name, content, is_stub, is_package))
+
+        # .py files first so that stubs can override their signatures deterministically
+        sources.sort(key=lambda source: (source[2], source[0]))
+        for module_name, content, is_stub, is_package in sources:
+            self.inspect_source(module_name, content, is_stub, is_package)
+        self.walk_modules()
+
+        # compiled modules shipped with a stub need no runtime inspection
+        self.compiled_modules = compiled - stubs
+        return sorted(self.compiled_modules)
+
+
+def extract_static_signatures(archive_path, library_name, save_dir) -> List[str]:
+    '''
+    Extract signatures from a local wheel / sdist and save them into save_dir.
+
+    Returns:
+        list: compiled modules without stubs, which still need to be inspected at runtime.
+    '''
+    print(f'Extracting signatures statically from {archive_path} ...')
+    inspector = StaticAPIInspector(library_name)
+    compiled_modules = inspector.inspect_archive(archive_path)
+    inspector.save_signatures(save_dir)
+    return compiled_modules
+
+
+def merge_signatures(save_dir, runtime_dir):
+    '''merge runtime signatures of compiled modules into the static ones, static results win'''
+    for name in ['function', 'method', 'function_ref', 'method_ref']:
+        static_path = os.path.join(save_dir, f'{name}.json')
+        runtime_path = os.path.join(runtime_dir, f'{name}.json')
+        if not os.path.exists(runtime_path):
+            continue
+        with open(static_path, 'r', encoding='utf-8') as f:
+            signatures = json.load(f)
+        with open(runtime_path, 'r', encoding='utf-8') as f:
+            for key, value in json.load(f).items():
+                signatures.setdefault(key, value)
+        with open(static_path, 'w', encoding='utf-8') as f:
+            json.dump(signatures, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--archive", type=str, required=True)
+    parser.add_argument("--lib", type=str, required=True)
+    parser.add_argument("--save_dir", type=str, required=True)
+
+    args = parser.parse_args()
+    compiled_modules = extract_static_signatures(args.archive, args.lib, args.save_dir)
+    if compiled_modules:
+        print(f'Compiled modules left for runtime inspection: {compiled_modules}')
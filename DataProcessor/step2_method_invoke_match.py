@@ -12,6 +12,7 @@ import warnings
 from typing import List, Dict, Tuple, Any, Optional
 
 from step3_deal_log import process_log_file
+from DataProcessor.api_alias import api_spellings
 from step4_metadata_generate import step_4
 
 
@@ -23,12 +24,14 @@ class ClassUsageFinder(ast.NodeVisitor):
     并在后续代码中跟踪这些变量是否调用了目标方法。
     """
 
-    def __init__(self, full_class_name: str, method_name: str):
+    def __init__(self, full_class_name: str, method_name: str, class_aliases: Optional[List[str]] = None):
         """
         :param full_class_name: 目标类的全名，如 "torch.nn.Linear"
         :param method_name: 要查找的目标方法名，如 "forward"
+        :param class_aliases: 目标类的其他写法（重导出路径、继承该方法的子类），如 ["torch.nn.modules.linear.Linear"]
         """
         self.full_class_name = full_class_name
+        self.class_names = {full_class_name, *(class_aliases or [])}
         self.method_name = method_name
 
         # 收集导入别名映射，如 "nn" -> "torch.nn"
@@ -95,7 +98,7 @@ class ClassUsageFinder(ast.NodeVisitor):
         判断一个字符串（可能是别名展开后）是否是我们的目标类名。
         例如目标类为 'torch.nn.Linear'，那么展开后若正好为 'torch.nn.Linear' 即匹配。
         """
-        return (raw_name == self.full_class_name)
+        return raw_name in self.class_names
 
     def _matches_target_class_constructor(self, call_node: ast.Call) -> bool:
         """
@@ -163,7 +166,7 @@ class ClassUsageFinder(ast.NodeVisitor):
             if arg.annotation:
                 # 可能是 ast.Name / ast.Attribute / ast.Subscript 等
                 anno_name = self._get_full_annotation_name(arg.annotation)
-                if anno_name == self.full_class_name:
+                if self._is_target_class_name(anno_name):
                     # 这个参数就是我们的目标类
                     self.current_local_vars[arg.arg] = self.full_class_name
 
@@ -212,7 +215,7 @@ class ClassUsageFinder(ast.NodeVisitor):
             anno_name = ""
             if node.annotation:
                 anno_name = self._get_full_annotation_name(node.annotation)
-            if anno_name == self.full_class_name:
+            if self._is_target_class_name(anno_name):
                 # 将该变量标记为目标类
                 self._mark_var_as_target_class(var_name)
 
@@ -269,7 +272,8 @@ class ClassUsageFinder(ast.NodeVisitor):
 def find_class_method_usage(
     code_str: str,
     class_full_name: str,
-    method_name: str
+    method_name: str,
+    class_aliases: Optional[List[str]] = None
 ) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
     """
     在给定的 Python 代码字符串中，查找 `class_full_name` 类的构造调用和对其指定方法 `method_name` 的调用。
@@ -280,7 +284,7 @@ def find_class_method_usage(
        method_calls:      List[(lineno, var_name)]
     """
     tree = ast.parse(code_str)
-    finder = ClassUsageFinder(class_full_name, method_name)
+    finder = ClassUsageFinder(class_full_name, method_name, class_aliases)
     finder.visit(tree)
     return finder.constructor_calls, finder.method_calls
 
@@ -288,7 +292,7 @@ def find_class_method_usage(
 
 # if __name__ == "__main__":
 
-def method_api_detector(config):
+def method_api_detector(config, aliases=None):
 
     apis_dir = os.path.join(config.raw_data_dir, 'method')
     if not os.path.exists(config.temp_dir):
@@ -297,6 +301,8 @@ def method_api_detector(config):
 
     f = open(log_path, 'w')
     ans = {}
+    # canonical method -> other spellings, i.e. torch.nn.Module.to -> [torch.nn.Linear.to, ...]
+    spellings = api_spellings(aliases or {})
     for fname in os.listdir(apis_dir):
         lists = []
         if not fname.endswith(".jsonl"):
@@ -307,6 +313,7 @@ def method_api_detector(config):
             continue
         target_method = parts[-1]
         target_class = ".".join(parts[:-1])
+        class_aliases = [name.rsplit(".", 1)[0] for name in spellings.get(base_name, [])]
         f.write(f"Processing file: {fname}\n")
         with open(os.path.join(apis_dir, fname), "r", encoding="utf-8") as f:
             for i, line in enumerate(f, start=1):
@@ -315,7 +322,7 @@ def method_api_detector(config):
                 try:
                     with warnings.catch_warnings():
                         warnings.simplefilter("ignore", SyntaxWarning)
-                        constructors, method_usages = find_class_method_usage(sample_code, target_class, target_method)
+                        constructors, method_usages = find_class_method_usage(sample_code, target_class, target_method, class_aliases)
                     if len(method_usages) != 0: 
                         f.write(f"遍历到json {i}\n")
                         lists.append(i)
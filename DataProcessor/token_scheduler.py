@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+
+
+SEARCH = 'search'
+CORE = 'core'
+GRAPHQL = 'graphql'
+# limits assumed for a token before its first response tells the real ones
+DEFAULT_LIMITS = {SEARCH: 10, CORE: 5000, GRAPHQL: 5000}
+# a 429 without any rate-limit header is a secondary rate limit
+SECONDARY_LIMIT_WAIT = 60
+# retries of a request (rate limits, server and network errors) before its failure is given to the caller
+MAX_RETRIES = 5
+# only waits at least this long are reported
+LOG_WAIT = 10
+
+
+def endpoint_class(url) -> str:
+    '''search, GraphQL and all other (core) endpoints have separate rate limits'''
+    if '/search/' in url:
+        return SEARCH
+    return GRAPHQL if url.rstrip('/').endswith('/graphql') else CORE
+
+
+class TokenScheduler:
+    """
+    Hand out GitHub tokens by their rate-limit headroom.
+
+    A bucket is kept per (token, endpoint class) and updated from the X-RateLimit-Remaining / X-RateLimit-Reset
+    and Retry-After headers of every response. Each request goes to the token with the most remaining quota,
+    and when every token is exhausted the caller sleeps only until the earliest reset.
+    Thread-safe, one scheduler is shared by all crawler threads.
+    """
+    # every access does file I/O, async callers run it in a thread instead of on the event loop
+    blocking = False
+
+    def __init__(self, tokens, limits: Optional[Dict[str, int]] = None):
+        self.tokens = list(tokens)
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.lock = threading.Lock()
+        self.buckets = {key: self.new_bucket(key) for key in self.bucket_keys()}
+
+    def bucket_keys(self):
+        return [(token, endpoint) for token in self.tokens for endpoint in self.limits]
+
+    def new_bucket(self, key):
+        limit = self.limits[key[1]]
+        return {'limit': limit, 'remaining': limit, 'reset': 0.0, 'blocked_until': 0.0}
+
+    @contextmanager
+    def locked(self):
+        '''exclusive access to the buckets'''
+        with self.lock:
+            yield self.buckets
+
+    @staticmethod
+    def headroom(bucket, now) -> int:
+        if now < bucket['blocked_until']:
+            return 0
+        if bucket['reset'] and now >= bucket['reset']:
+            # the window has been reset since the last response
+            return bucket['limit']
+        return bucket['remaining']
+
+    def try_acquire(self, endpoint=CORE) -> Tuple[Optional[str], float]:
+        '''
+        reserve one request on the token with the most headroom
+
+        Returns:
+            (token, 0) if a token is available, otherwise (None, seconds until the earliest reset)
+        '''
+        now = time.time()
+        with self.locked() as all_buckets:
+            buckets = [(self.headroom(all_buckets[(token, endpoint)], now), token) for token in self.tokens]
+            headroom, token = max(buckets, key=lambda bucket: bucket[0])
+            if headroom > 0:
+                bucket = all_buckets[(token, endpoint)]
+                if bucket['reset'] and now >= bucket['reset']:
+                    bucket['reset'] = 0.0
+                bucket['remaining'] = headroom - 1
+                return token, 0
+            wait = min(max(bucket['reset'], bucket['blocked_until']) for (_, kind), bucket in all_buckets.items()
+                       if kind == endpoint) - now
+            return None, max(wait, 1)
+
+    def acquire(self, endpoint=CORE) -> str:
+        '''reserve one request, sleeping until the earliest reset if every token is exhausted'''
+        while True:
+            token, wait = self.try_acquire(endpoint)
+            if token is not None:
+                return token
+            if wait >= LOG_WAIT:
+                print(f"\nAll tokens exhausted for {endpoint} requests, waiting {wait:.0f}s\n")
+            time.sleep(wait)
+
+    def release(self, token, endpoint=CORE):
+        '''give back the reservation of a request that was never answered (network error)'''
+        with self.locked() as all_buckets:
+            bucket = all_buckets[(token, endpoint)]
+            bucket['remaining'] = min(bucket['remaining'] + 1, bucket['limit'])
+
+    def update(self, token, endpoint, status, headers):
+        '''record the rate-limit state sent back with a response of token'''
+        now = time.time()
+        with self.locked() as all_buckets:
+            bucket = all_buckets[(token, endpoint)]
+            if 'X-RateLimit-Limit' in headers:
+                bucket['limit'] = int(headers['X-RateLimit-Limit'])
+            if 'X-RateLimit-Remaining' in headers:
+                remaining = int(headers['X-RateLimit-Remaining'])
+                reset = float(headers.get('X-RateLimit-Reset', bucket['reset']))
+                if reset == bucket['reset']:
+                    # responses of the same window may arrive out of order, and requests reserved since are in flight
+                    remaining = min(remaining, bucket['remaining'])
+                bucket['remaining'], bucket['reset'] = remaining, reset
+            if 'Retry-After' in headers:
+                bucket['blocked_until'] = now + float(headers['Retry-After'])
+            elif status == 429 and bucket['remaining'] > 0:
+                bucket['blocked_until'] = now + SECONDARY_LIMIT_WAIT
+
+    def is_rate_limited(self, status, headers) -> bool:
+        '''
+        responses that must be retried with another token, instead of being returned: every response update blocks
+        its token for (Retry-After, or a 429 with quota left, i.e. a secondary rate limit) and a 403 / 429 of an
+        exhausted window. Any other 403 (i.e. a forbidden resource) is a failure of the request
+        '''
+        if status == 429 or 'Retry-After' in headers:
+            return True
+        return status == 403 and headers.get('X-RateLimit-Remaining') == '0'
+
+
+class SharedTokenScheduler(TokenScheduler):
+    """
+    TokenScheduler whose buckets live in a state file shared by every crawler process on the machine, so that
+    several crawlers (i.e. pipelines of different libraries) lease quota from the same pool instead of overdrawing it.
+
+    Every access holds an exclusive fcntl lock on {state_file}.lock, the state is replaced atomically and
+    tokens are only stored by their sha256, never in clear text. POSIX only.
+    """
+    blocking = True
+
+    def __init__(self, tokens, state_file, limits: Optional[Dict[str, int]] = None):
+        self.state_file = state_file
+        state_dir = os.path.dirname(state_file)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        super().__init__(tokens, limits)
+
+    @staticmethod
+    def token_id(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+
+    def load(self) -> Dict:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def dump(self, state):
+        tmp_path = f'{self.state_file}.tmp-{os.getpid()}'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_file)
+
+    @contextmanager
+    def locked(self):
+        import fcntl
+
+        with self.lock, open(f'{self.state_file}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                state = self.load()
+                buckets = {}
+                for key in self.bucket_keys():
+                    stored = state.get(f'{self.token_id(key[0])}/{key[1]}')
+                    buckets[key] = stored if stored is not None else self.new_bucket(key)
+                yield buckets
+                for key, bucket in buckets.items():
+                    state[f'{self.token_id(key[0])}/{key[1]}'] = bucket
+                self.dump(state)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create_scheduler(tokens, state_file=None) -> TokenScheduler:
+    '''a scheduler private to this process, or shared through state_file with other processes'''
+    if state_file is None:
+        return TokenScheduler(tokens)
+    return SharedTokenScheduler(tokens, state_file)
@@ -0,0 +1,99 @@
+import re
+from typing import Dict, List, Set
+
+
+
+# import statements, parenthesized from-imports may span lines and hold comments
+IMPORT_STATEMENT = r'^[ \t]*(?:from[ \t]+(?P<module>[\w.]+)[ \t]+import[ \t]+(?:\((?P<group>(?:[^)#]|#[^\n]*$)*)\)|(?P<names>[^\n#;]*))' \
+                   r'|import[ \t]+(?P<modules>[^\n#;]*))'
+
+
+def trie_pattern(words) -> str:
+    '''
+    a regex alternation of the words in the shape of their prefix trie, i.e. \\.(?:Linear|nn\\.(?:Linear|ReLU)),
+    so that shared prefixes are matched once and every branch fails at its first unmatched character
+    '''
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return _node_pattern(trie)
+
+
+def _node_pattern(node) -> str:
+    optional = '' in node
+    branches = [re.escape(char) + _node_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if optional:
+        pattern = f'(?:{pattern})?'
+    return pattern
+
+
+def imported_names(text) -> List[List[str]]:
+    '''[[dotted name, bound name]] of the comma separated clauses of an import statement'''
+    names = []
+    text = re.sub(r'#[^\n]*', '', text)
+    for clause in text.replace('\\', ' ').split(','):
+        words = clause.split()
+        if len(words) == 1:
+            # import torch.nn binds torch only
+            names.append([words[0].split('.')[0]] * 2)
+        elif len(words) == 3 and words[1] == 'as':
+            names.append([words[0], words[2]])
+    return names
+
+
+class UsageMatcher:
+    """
+    Decide in a single pass over a file whether it uses any of the given API names, compiled once per API.
+
+    A use is a dotted name `head.tail` where tail is a suffix of an API (.nn.Linear, .Linear for torch.nn.Linear)
+    and head is bound to the rest of it: the module itself (torch.nn.Linear), an alias (import torch.nn as tnn;
+    tnn.Linear), or a from-import (from torch import nn; nn.Linear). Importing the API itself
+    (from torch.nn import Linear) is a use too. All suffixes are matched by one trie-shaped alternation next to the
+    import statements, and uses seen before the import binding their head are resolved at the end.
+    """
+    def __init__(self, api_names):
+        self.apis = set(api_names)
+        # {.suffix: modules the suffix is used on}
+        self.tails: Dict[str, Set[str]] = {}
+        for api_name in self.apis:
+            parts = api_name.split('.')
+            for i in range(1, len(parts)):
+                self.tails.setdefault('.' + '.'.join(parts[i:]), set()).add('.'.join(parts[:i]))
+        self.modules = set().union(*self.tails.values())
+
+        pattern = IMPORT_STATEMENT
+        if self.tails:
+            pattern += rf'|(?<![\w.])(?P<head>[A-Za-z_]\w*)(?P<tail>{trie_pattern(self.tails)})(?!\w)'
+        self.regex = re.compile(pattern, re.M)
+
+    def matches(self, code_content) -> bool:
+        if not code_content:
+            return False
+        bindings: Dict[str, Set[str]] = {}
+        pending = []
+        for match in self.regex.finditer(code_content):
+            head = match.group('head') if self.tails else None
+            if head is not None:
+                modules = self.tails[match.group('tail')]
+                if head in modules or bindings.get(head, set()) & modules:
+                    return True
+                pending.append((head, modules))
+                continue
+            if match.group('module') is not None:
+                module = match.group('module')
+                text = match.group('group') if match.group('group') is not None else match.group('names')
+                names = [[f'{module}.{name}', alias] for name, alias in imported_names(text)]
+            else:
+                names = imported_names(match.group('modules'))
+            for name, alias in names:
+                if name in self.apis:
+                    return True
+                if name in self.modules:
+                    bindings.setdefault(alias, set()).add(name)
+        return any(bindings.get(head, set()) & modules for head, modules in pending)
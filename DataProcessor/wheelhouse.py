@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import stat
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import argparse
+import subprocess
+import threading
+from typing import Dict, List
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+
+
+def sha256_file(path, chunk_size=1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write(path, data: bytes, mode=None):
+    '''write into a temporary file first, concurrent writers of the same content never see a partial file'''
+    tmp_path = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    if mode is not None:
+        os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+
+class PackageCache:
+    """
+    Content-addressed cache of unpacked wheels.
+
+    Every file of a wheel is stored once under objects/{sha256[:2]}/{sha256}, and manifests/{wheel sha256}.json lists
+    (path in the wheel, object, executable) of the wheel. A venv is populated by hardlinking the objects, so a file
+    shared by many envs (i.e. numpy of the same release) takes disk space only once. Objects are read-only,
+    since every linked env shares them.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.manifests_dir = os.path.join(cache_dir, 'manifests')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def add_object(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, data, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        return digest
+
+    def unpack(self, wheel_path) -> List[List]:
+        '''unpack a wheel into the cache once, return its manifest [[member path, object, executable], ...]'''
+        manifest_path = os.path.join(self.manifests_dir, f'{sha256_file(wheel_path)}.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        manifest = []
+        with zipfile.ZipFile(wheel_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                executable = bool((info.external_attr >> 16) & stat.S_IXUSR)
+                manifest.append([info.filename, self.add_object(zf.read(info)), executable])
+        atomic_write(manifest_path, json.dumps(manifest).encode('utf-8'))
+        return manifest
+
+    def link(self, digest, target_path, executable=False):
+        '''hardlink an object to target_path, copy it if the cache is on another file system'''
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if os.path.lexists(target_path):
+            os.remove(target_path)
+        source_path = self.object_path(digest)
+        if executable:
+            # the mode is shared by all links of an object, so executables get their own copy
+            shutil.copyfile(source_path, target_path)
+            os.chmod(target_path, 0o755)
+            return
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copyfile(source_path, target_path)
+
+
+def venv_python(venv_dir):
+    if sys.platform == 'win32':
+        return os.path.join(venv_dir, 'Scripts', 'python.exe')
+    return os.path.join(venv_dir, 'bin', 'python')
+
+
+def venv_paths(venv_dir) -> Dict[str, str]:
+    '''sysconfig install paths (purelib, platlib, data, ...) of a venv'''
+    output = subprocess.check_output([venv_python(venv_dir), '-c',
+                                      'import json, sysconfig; print(json.dumps(sysconfig.get_paths()))'])
+    return json.loads(output)
+
+
+def resolve_wheels(requirement, wheelhouse, log_file=None) -> List[str]:
+    '''
+    resolve requirement with its dependencies against the wheelhouse only (no network) and return the wheel paths.
+    pip is run with the current interpreter, which is also the base interpreter of the created venvs.
+    '''
+    fd, report_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    cmd = [sys.executable, '-m', 'pip', 'install', requirement, '--dry-run', '--ignore-installed', '--quiet',
+           '--no-index', '--find-links', wheelhouse, '--only-binary', ':all:', '--report', report_path]
+    try:
+        if log_file is not None:
+            subprocess.check_call(cmd, stdout=log_file, stderr=subprocess.STDOUT)
+        else:
+            subprocess.check_call(cmd)
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    except subprocess.CalledProcessError as e:
+        raise Exception(f'Failed to resolve {requirement} from wheelhouse {wheelhouse}: {e}')
+    finally:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+
+    wheels = []
+    for item in report['install']:
+        url = urlparse(item['download_info']['url'])
+        wheels.append(url2pathname(url.path))
+    return wheels
+
+
+def install_wheel(cache, wheel_path, paths):
+    '''link the files of a wheel into a venv, the `.data/` directories go to the matching install paths'''
+    for member, digest, executable in cache.unpack(wheel_path):
+        parts = member.split('/')
+        if parts[0].endswith('.data') and len(parts) > 2:
+            scheme = parts[1]
+            if scheme not in ['purelib', 'platlib', 'data', 'headers']:
+                # console scripts need a rewritten shebang, they are not needed for inspection
+                continue
+            target_dir = paths['include'] if scheme == 'headers' else paths[scheme]
+            target_path = os.path.join(target_dir, *parts[2:])
+        else:
+            target_path = os.path.join(paths['purelib'], *parts)
+        cache.link(digest, target_path, executable)
+
+
+def provision_venv(venv_dir, lib, version, wheelhouse, cache_dir, log_file=None):
+    '''
+    Create a venv for lib==version from a local wheelhouse without any network access.
+    The wheels are unpacked once into a shared PackageCache and hardlinked into the venv.
+    '''
+    print('-' * 40)
+    print(f'Provisioning {lib}={version} from wheelhouse {wheelhouse} ...')
+    cache = PackageCache(cache_dir)
+    wheels = resolve_wheels(f'{lib}=={version}', wheelhouse, log_file)
+    try:
+        subprocess.check_call([sys.executable, '-m', 'venv', '--without-pip', venv_dir])
+        paths = venv_paths(venv_dir)
+        for wheel_path in wheels:
+            install_wheel(cache, wheel_path, paths)
+    except Exception:
+        shutil.rmtree(venv_dir, ignore_errors=True)
+        raise
+    print(f'Virtual environment created at {venv_dir} with {len(wheels)} wheels')
+    print('-' * 40)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lib', type=str, required=True)
+    parser.add_argument('--version', type=str, required=True)
+    parser.add_argument('--wheelhouse', type=str, required=True)
+    parser.add_argument('--cache_dir', type=str, required=True)
+    parser.add_argument('--venv_dir', type=str, required=True)
+    args = parser.parse_args()
+
+    provision_venv(args.venv_dir, args.lib, args.version, args.wheelhouse, args.cache_dir)
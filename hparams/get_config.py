@@ -27,6 +27,60 @@ def get_dataset_config():
     config  = Config(config)
     if config.mirror == 'None':
         config.mirror = None
+    if not hasattr(config, 'env_workers'):
+        config.env_workers = 4
+    if getattr(config, 'archive_dir', 'None') == 'None':
+        config.archive_dir = None
+    if getattr(config, 'snapshot_cache_dir', 'None') == 'None':
+        config.snapshot_cache_dir = None
+    if getattr(config, 'signature_store', 'None') == 'None':
+        config.signature_store = None
+    if getattr(config, 'wheelhouse', 'None') == 'None':
+        config.wheelhouse = None
+    if getattr(config, 'package_cache_dir', 'None') == 'None':
+        config.package_cache_dir = None
+    if not hasattr(config, 'inspector_args'):
+        config.inspector_args = []
+    if getattr(config, 'token_state_file', 'None') == 'None':
+        config.token_state_file = None
+    if not hasattr(config, 'crawler_backend'):
+        config.crawler_backend = 'sync'
+    if not hasattr(config, 'concurrency'):
+        config.concurrency = 32
+    if getattr(config, 'repo_cache_path', 'None') == 'None':
+        config.repo_cache_path = None
+    if not hasattr(config, 'repo_cache_ttl_days'):
+        config.repo_cache_ttl_days = 7
+    if getattr(config, 'blob_store_dir', 'None') == 'None':
+        config.blob_store_dir = None
+    if getattr(config, 'http_cache_path', 'None') == 'None':
+        config.http_cache_path = None
+    if not hasattr(config, 'http_cache_max_age'):
+        config.http_cache_max_age = 86400
+    if getattr(config, 'clone_threshold', 'None') == 'None':
+        config.clone_threshold = None
+    if not hasattr(config, 'clone_dir'):
+        config.clone_dir = 'CodeSync/Crawl_Cache/clones'
+    if not hasattr(config, 'clone_url'):
+        config.clone_url = 'https://github.com/{full_name}.git'
+    if not hasattr(config, 'resume_crawl'):
+        config.resume_crawl = True
+    if getattr(config, 'query_stats_file', 'None') == 'None':
+        config.query_stats_file = None
+    if not hasattr(config, 'group_queries'):
+        config.group_queries = True
+    if not hasattr(config, 'usage_filter'):
+        config.usage_filter = True
+    if not hasattr(config, 'global_queue'):
+        config.global_queue = True
+    if getattr(config, 'search_budget', 'None') == 'None':
+        config.search_budget = None
+    if getattr(config, 'local_corpus', 'None') == 'None':
+        config.local_corpus = None
+    if getattr(config, 'local_corpus_metadata', 'None') == 'None':
+        config.local_corpus_metadata = None
+    if getattr(config, 'local_workers', 'None') == 'None':
+        config.local_workers = None
     return config
 
 
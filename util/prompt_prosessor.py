@@ -16,7 +16,7 @@ def sample_processor(prompt_dict):
     suffix = '\n'.join(prompt_dict['code'].split('\n')[prompt_dict['end_line_no']:])
 
     # find full name of api in code snippet
-    api_name_list = prompt_dict['API_path'].split('.')
+    api_name_list = prompt_dict.get('spelled_as', prompt_dict['API_path']).split('.')
     for i in range(len(api_name_list)):
         api_name = '.'.join(api_name_list[i:])
         calling_list = calling.split(api_name)